@@ -0,0 +1,12 @@
+"""
+Headless benchmarks of the navigation core.
+
+stage.py stands in for Evennia, Django and Twisted in memory, scenarios.py
+builds worlds of 100 to 10,000 vessels in calm or gridded weather, on the
+open ocean or along a coast, and run.py runs them and reports ticks per
+second, per-stage latency and memory. From the game directory, with numpy:
+
+    python -m bench.run --stages
+
+Nothing here is imported by the game.
+"""
@@ -0,0 +1,225 @@
+# Benchmark Runner
+"""
+Run the benchmark scenarios (see bench/scenarios.py) headless and report
+how fast the simulation goes. From the game directory:
+
+    python -m bench.run                       every scenario
+    python -m bench.run -v 1000 -w gridded    some of them
+    python -m bench.run --stages              per-stage latency as well
+    python -m bench.run --json > before.json  raw results, to compare
+
+Each scenario runs in a process of its own, so that the module state of
+one does not leak into the next and memory is measured on its own. It is
+built, the server started, WARMUP hours run to get every vessel on a
+course, and then metrics (see world/metrics.py) are switched on for the
+hours measured. The report has
+
+    setup      seconds to build the world and start the server
+    ticks/s    fleet ticks (simulated hours) run per second of wall time
+    tick ms    mean and worst time of a fleet tick
+    events     navigation events handled, and how many per second
+    messages   messages sent to players aboard
+    memory     peak resident size of the process, and the growth in
+               objects the garbage collector tracks over the hours
+               measured; with tracemalloc (Python 3) the peak of memory
+               allocated while measuring as well
+
+Wall time is everything that runs in the hours measured: fleet ticks, the
+navigation schedule, sighting sweeps, weather ticks and write-behind
+flushes.
+"""
+
+import argparse
+import gc
+import json
+import shutil
+import subprocess
+import sys
+from timeit import default_timer
+
+WARMUP = 2.0  # simulation hours run before measuring
+HOURS = 24.0  # simulation hours measured
+
+
+def measure(vessels, weather_kind, waters, hours=HOURS, seed=1):
+    '''
+    Build and run one scenario in this process and return its results.
+    Only one scenario can run in a process.
+    '''
+    from bench import stage as stages
+    stage = stages.install()
+    from bench import scenarios
+    from world import clock, metrics
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    started = default_timer()
+    files = scenarios.build(vessels, weather_kind, waters, WARMUP + hours,
+                            seed)
+    scenarios.start()
+    setup = default_timer() - started
+    stage.advance(clock.seconds(WARMUP))
+
+    gc.collect()
+    objects = len(gc.get_objects())
+    messages = stage.messages
+    if tracemalloc:
+        tracemalloc.start()
+    metrics.enable()
+    started = default_timer()
+    stage.advance(clock.seconds(hours))
+    elapsed = default_timer() - started
+    metrics.enable(False)
+    peak = tracemalloc.get_traced_memory()[1] if tracemalloc else None
+    if tracemalloc:
+        tracemalloc.stop()
+    counts, times = metrics.snapshot()
+    shutil.rmtree(files, ignore_errors=True)
+
+    ticks, total, worst = times.get("fleet.tick", (0, 0.0, 0.0))
+    events = sum(number for name, number in counts.items()
+                 if name.startswith("navigation.") and
+                 name not in ("navigation.stale", "navigation.predicted"))
+    return {
+        "vessels": vessels, "weather": weather_kind, "waters": waters,
+        "hours": hours, "setup": setup, "elapsed": elapsed,
+        "ticks": ticks, "ticks_per_second": ticks / elapsed,
+        "tick_ms": total * 1000 / ticks if ticks else 0.0,
+        "worst_tick_ms": worst * 1000,
+        "events": events, "events_per_second": events / elapsed,
+        "messages": stage.messages - messages,
+        "peak_rss_mb": _peak_rss(),
+        "objects": len(gc.get_objects()) - objects,
+        "traced_peak_mb": peak / 2.0 ** 20 if peak is not None else None,
+        "stages": dict((name, {"calls": calls, "total_ms": total * 1000,
+                               "mean_ms": total * 1000 / calls,
+                               "worst_ms": worst * 1000})
+                       for name, (calls, total, worst) in times.items()),
+        "counts": counts,
+        "errors": [text for level, text in stage.log
+                   if level in ("error", "trace")],
+    }
+
+
+def report(results, stages=False):
+    '''
+    The results of scenarios as lines of text.
+    '''
+    lines = ["%7s %-8s %-8s %7s %9s %17s %9s %9s %9s %9s" %
+             ("vessels", "weather", "waters", "setup s", "ticks/s",
+              "tick ms mean/max", "events/s", "messages", "rss MB",
+              "objects")]
+    for result in results:
+        if "failed" in result:
+            lines.append("%7d %-8s %-8s failed: %s" %
+                         (result["vessels"], result["weather"],
+                          result["waters"], result["failed"]))
+            continue
+        lines.append("%7d %-8s %-8s %7.1f %9.1f %8.2f/%8.2f %9.0f %9d "
+                     "%9.1f %+9d" %
+                     (result["vessels"], result["weather"], result["waters"],
+                      result["setup"], result["ticks_per_second"],
+                      result["tick_ms"], result["worst_tick_ms"],
+                      result["events_per_second"], result["messages"],
+                      result["peak_rss_mb"], result["objects"]))
+        if result["traced_peak_mb"] is not None:
+            lines.append("%34s allocated at most %.1f MB while measured" %
+                         ("", result["traced_peak_mb"]))
+        for error in result["errors"]:
+            lines.append("%34s error: %s" % ("", error))
+        if stages:
+            for name, stage in sorted(result["stages"].items(),
+                                      key=lambda item: -item[1]["total_ms"]):
+                lines.append("%34s %-24s %8d calls %9.3f ms mean %9.3f max" %
+                             ("", name, stage["calls"], stage["mean_ms"],
+                              stage["worst_ms"]))
+    return lines
+
+
+def main(argv=None):
+    from bench import stage
+    stage.install()
+    from bench import scenarios
+    parser = argparse.ArgumentParser(
+        prog="python -m bench.run",
+        description="Benchmark the navigation core headless.")
+    parser.add_argument("-v", "--vessels", type=int, action="append",
+                        help="number of vessels (%s)" %
+                        ", ".join(map(str, scenarios.VESSELS)))
+    parser.add_argument("-w", "--weather", action="append",
+                        choices=scenarios.WEATHERS)
+    parser.add_argument("-s", "--waters", action="append",
+                        choices=scenarios.WATERS)
+    parser.add_argument("--hours", type=float, default=HOURS,
+                        help="simulation hours to measure (%(default)s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--stages", action="store_true",
+                        help="report the latency of every stage")
+    parser.add_argument("--json", action="store_true",
+                        help="print the raw results as JSON")
+    parser.add_argument("--one", action="store_true",
+                        help="run one scenario in this process")
+    args = parser.parse_args(argv)
+
+    vessels = args.vessels or scenarios.VESSELS
+    weathers = args.weather or scenarios.WEATHERS
+    waters = args.waters or scenarios.WATERS
+    if args.one:
+        result = measure(vessels[0], weathers[0], waters[0], args.hours,
+                         args.seed)
+        sys.stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    results = []
+    for number in vessels:
+        for weather_kind in weathers:
+            for water in waters:
+                results.append(_spawn(number, weather_kind, water,
+                                      args.hours, args.seed))
+                if not args.json:
+                    sys.stderr.write("\n".join(report(results[-1:],
+                                                      args.stages)[1:]) +
+                                     "\n")
+    if args.json:
+        sys.stdout.write(json.dumps(results, indent=1) + "\n")
+    else:
+        sys.stdout.write("\n".join(report(results, args.stages)) + "\n")
+    return 0
+
+
+def _spawn(vessels, weather_kind, waters, hours, seed):
+    '''
+    Run one scenario in a new process and return its results.
+    '''
+    command = [sys.executable, "-m", "bench.run", "--one",
+               "-v", str(vessels), "-w", weather_kind, "-s", waters,
+               "--hours", str(hours), "--seed", str(seed)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, errors = process.communicate()
+    if process.returncode:
+        lines = errors.decode("utf-8", "replace").strip().splitlines()
+        return {"vessels": vessels, "weather": weather_kind,
+                "waters": waters,
+                "failed": lines[-1] if lines else process.returncode}
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def _peak_rss():
+    '''
+    Peak resident size of this process in MB, or 0 where unknown.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 if sys.platform != "darwin" else peak / 2.0 ** 20
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# last line
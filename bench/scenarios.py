@@ -0,0 +1,196 @@
+# Benchmark Scenarios
+"""
+Worlds to benchmark the navigation core in, built on the stage (see
+bench/stage.py), which has to be installed before this module is imported.
+
+A scenario is a number of vessels, the weather and the waters:
+
+    weather  calm     - one global wind and no current, which never changes
+             gridded  - a 1 degree global grid of wind and current from a
+                        weather archive, a new frame every FRAME hours
+    waters   ocean    - open water everywhere
+             coastal  - a continent to the east with a ragged coastline,
+                        islands, a coastline land mask and a coastal room
+                        every PORTS degrees along the coast
+
+Vessels start at random in AREA, the same ones for the same seed: most
+under sail, some rowing, some just flotsam adrift. A few have a player
+aboard (CREWED), which is what makes the fleet watch them and their
+neighbours closely and the lookouts sweep, and some are on autopilot
+(PILOTED) for a few waypoints.
+
+build() makes the objects, as if they were in the database already, and
+start() then starts the server the way server/conf/at_server_startstop.py
+does, rebuilding every index from them.
+"""
+
+import os
+import tempfile
+from random import Random
+import numpy as np
+from evennia.utils.create import create_object, create_script
+from world import atlas, autopilot, fleet, landmask, polars, roompool
+from world import sighting, weather, writeback
+from world.fields import to_components
+from world.weather_archive import write_archive
+
+VESSELS = (100, 1000, 10000)
+WEATHERS = ("calm", "gridded")
+WATERS = ("ocean", "coastal")
+
+AREA = (-30.0, 30.0, -40.0, 40.0)  # lat and lon limits vessels start in
+SAILING = 0.6  # fraction of vessels under sail, the rest row or drift
+ROWING = 0.2
+CREWED = 0.05  # fraction of vessels with a player aboard
+PILOTED = 0.1  # fraction of vessels on autopilot
+POLAR = "test"  # POL/test.pol
+FRAME = 6.0  # simulation hours between frames of gridded weather
+COAST = 25.0  # mean longitude of the coastline
+PORTS = 2.0  # degrees of latitude between coastal rooms
+MASK_STEP = 0.1  # degrees, cells of the coastline land mask
+
+
+def build(vessels, weather_kind="calm", waters="ocean", hours=48.0, seed=1):
+    '''
+    Make the world of a scenario, with weather for at least hours. Returns
+    the temporary directory holding its files.
+    '''
+    random = Random(seed)
+    files = tempfile.mkdtemp(prefix="bench")
+    polars.load(os.path.join(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))), "POL"))
+    wind = create_script("scripts.WorldWind")
+    if weather_kind == "gridded":
+        path = os.path.join(files, "weather.pwx")
+        _weather_archive(path, hours, random)
+        wind.set_archive(path)
+    else:
+        wind.set_wind(random.uniform(0, 360), 12.0)
+    if waters == "coastal":
+        path = os.path.join(files, "coast.lmask")
+        _coast(path, random)
+        landmask.load(path)
+    for number in range(vessels):
+        _vessel(number, random)
+    return files
+
+
+def start():
+    '''
+    Start the server on the world built: rebuild every index and start the
+    tickers, as at_server_start does.
+    '''
+    atlas.rebuild()
+    landmask.rebuild()
+    roompool.rebuild()
+    fleet.rebuild()
+    fleet.start()
+    autopilot.rebuild()
+    sighting.rebuild()
+    sighting.start()
+    weather.invalidate()
+    weather.start()
+    writeback.start()
+
+
+def _vessel(number, random):
+    '''
+    One vessel at a random fix at sea, in a sea room of its own.
+    '''
+    fix = _at_sea(random)
+    room = roompool.acquire(fix)
+    kind = random.random()
+    if kind < SAILING + ROWING:
+        vessel = create_object("vessel.VesselObject", key="ship %d" % number,
+                               location=room)
+        vessel.position = fix
+        vessel.heading = random.uniform(0, 360)
+        vessel.db.polar = POLAR
+        if kind < SAILING:
+            vessel.sails = 1.0
+            vessel.cast_off()
+        else:
+            vessel.get_underway(random.uniform(2.0, 5.0))
+        if random.random() < PILOTED:
+            autopilot.engage(vessel, [_near(fix, 5.0, random)
+                                      for _ in range(3)])
+    else:
+        vessel = create_object("vessel.FloatingObject",
+                               key="flotsam %d" % number, location=room)
+        vessel.position = fix
+    if random.random() < CREWED:
+        crew = create_object("characters.Character", key="crew %d" % number,
+                             location=vessel)
+        crew.has_player = True
+    return vessel
+
+
+def _at_sea(random):
+    '''
+    A random fix in AREA that is not on land.
+    '''
+    while True:
+        fix = (round(random.uniform(AREA[0], AREA[1]), 2),
+               round(random.uniform(AREA[2], AREA[3]), 2))
+        if not landmask.is_land(fix):
+            return fix
+
+
+def _near(fix, degrees, random):
+    '''
+    A random fix at sea within degrees of fix.
+    '''
+    while True:
+        near = (fix[0] + random.uniform(-degrees, degrees),
+                fix[1] + random.uniform(-degrees, degrees))
+        if abs(near[0]) < 80 and not landmask.is_land(near):
+            return near
+
+
+def _weather_archive(path, hours, random):
+    '''
+    Write a 1 degree global weather archive with a frame every FRAME hours
+    until hours: winds in bands of latitude with eddies drifting east, and
+    weaker currents under them.
+    '''
+    lats = np.arange(-90.0, 91.0)[:, None]
+    lons = np.arange(-180.0, 180.0)[None, :]
+    frames = np.arange(0.0, hours + 2 * FRAME, FRAME)
+    data = np.empty((len(frames), 4, lats.size, lons.size), dtype=np.float32)
+    phase = random.uniform(0, 2 * np.pi)
+    for index, hour in enumerate(frames):
+        drift = np.radians(lons - 2.0 * hour) + phase
+        directions = (90.0 + 60.0 * np.sin(np.radians(3 * lats)) +
+                      40.0 * np.sin(3 * drift) * np.cos(np.radians(lats)))
+        speeds = 12.0 + 8.0 * np.cos(2 * drift + np.radians(2 * lats))
+        data[index, 0], data[index, 1] = to_components(directions, speeds)
+        data[index, 2], data[index, 3] = to_components(directions + 30.0,
+                                                       speeds * 0.05)
+    write_archive(path, frames, data, -90.0, -180.0, 1.0)
+
+
+def _coast(path, random):
+    '''
+    Write a coastline land mask and chart a coastal room every PORTS
+    degrees along the coast.
+    '''
+    lats = np.arange(AREA[0] - 10, AREA[1] + 10 + MASK_STEP, MASK_STEP)
+    lons = np.arange(AREA[2] - 10, AREA[3] + 10 + MASK_STEP, MASK_STEP)
+    shore = COAST + 3.0 * np.sin(np.radians(lats * 20)) + \
+        np.sin(np.radians(lats * 170))
+    grid = lons[None, :] >= shore[:, None]
+    for _ in range(40):  # islands
+        lat = random.uniform(AREA[0], AREA[1])
+        lon = random.uniform(AREA[2], COAST - 5)
+        radius = random.uniform(0.2, 1.0)
+        grid |= (np.hypot(lats[:, None] - lat, lons[None, :] - lon) <
+                 radius)
+    landmask.LandMask.from_grid(grid, lats[0], lons[0], MASK_STEP).save(path)
+    for lat in np.arange(AREA[0], AREA[1], PORTS):
+        row = int(round((lat - lats[0]) / MASK_STEP))
+        lon = float(shore[row]) - MASK_STEP * 2
+        room = create_object("rooms.CoastalRoom",
+                             key="Port %.0f" % lat)
+        atlas.set_coordinates(room, (round(float(lat), 2), round(lon, 2)))
+
+# last line
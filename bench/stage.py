@@ -0,0 +1,455 @@
+# The Stage
+"""
+In-memory stand-ins for the parts of Evennia, Django and Twisted that the
+navigation core uses, so world/ and the vessel and room typeclasses run
+headless: no database, no server, no network.
+
+install() puts them in sys.modules under the real names, before anything
+imports Evennia, and returns the Stage that holds
+
+    objects     - every object "in the database", for search and create
+    now         - virtual seconds since the server started; gametime and
+                  the reactor both read it, so simulated hours pass as fast
+                  as the machine can work them out
+    advance()   - move the clock on, firing ticker callbacks and reactor
+                  calls in the order they fall due
+
+Objects keep Attributes (db) and non-persistent attributes (ndb) in plain
+dicts, and have contents, location and the hooks the typeclasses override,
+called in the order Evennia calls them. Messages are counted, not kept.
+Commands, cmdsets, locks and permissions do nothing.
+
+This is only for benchmarks (see bench/run.py); the game always runs on
+the real thing.
+"""
+
+import heapq
+import importlib
+import itertools
+import os
+import sys
+import types
+from contextlib import contextmanager
+
+GAME_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TYPECLASS_PATHS = ["typeclasses"]
+
+_STAGE = {"stage": None}
+
+
+class Stage(object):
+    """
+    The virtual clock, scheduler and object table the stand-ins share.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self.objects = {}  # id -> object
+        self.messages = 0  # msg() calls, see Object.msg
+        self.log = []  # (level, text) from the logger
+        self._ids = itertools.count(1)
+        self._calls = []  # heap of (when, sequence, DelayedCall)
+        self._tickers = {}  # (interval, callback, idstring) -> next due
+        self._sequence = itertools.count()
+
+    def call_later(self, delay, function, *args, **kwargs):
+        call = DelayedCall(self.now + max(delay, 0.0), function, args, kwargs)
+        heapq.heappush(self._calls, (call.time, next(self._sequence), call))
+        return call
+
+    def add_ticker(self, interval, callback, idstring=""):
+        self._tickers[(interval, callback, idstring)] = self.now + interval
+
+    def remove_ticker(self, interval, callback, idstring=""):
+        self._tickers.pop((interval, callback, idstring), None)
+
+    def advance(self, seconds):
+        '''
+        Let seconds pass, running everything that falls due on the way.
+        Returns the number of calls made.
+        '''
+        end = self.now + seconds
+        made = 0
+        while True:
+            calls = self._calls
+            while calls and not calls[0][2].live:
+                heapq.heappop(calls)
+            ticker = min(self._tickers.items(), key=lambda item: item[1]) \
+                if self._tickers else None
+            if calls and (ticker is None or calls[0][0] <= ticker[1]):
+                if calls[0][0] > end:
+                    break
+                call = heapq.heappop(calls)[2]
+                self.now = max(self.now, call.time)
+                call.live = False
+                call.function(*call.args, **call.kwargs)
+            elif ticker is not None and ticker[1] <= end:
+                (interval, callback, _), due = ticker
+                self.now = max(self.now, due)
+                self._tickers[ticker[0]] = due + interval
+                callback()
+            else:
+                break
+            made += 1
+        self.now = end
+        return made
+
+
+class DelayedCall(object):
+    """
+    What reactor.callLater hands back.
+    """
+    __slots__ = ("time", "function", "args", "kwargs", "live")
+
+    def __init__(self, time, function, args, kwargs):
+        self.time = time
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.live = True
+
+    def active(self):
+        return self.live
+
+    def cancel(self):
+        self.live = False
+
+    def getTime(self):
+        return self.time
+
+
+class Holder(object):
+    """
+    db or ndb: anything not set reads as None.
+    """
+    def __init__(self, values=None):
+        self.__dict__["_values"] = {} if values is None else values
+
+    def __getattr__(self, key):
+        return self._values.get(key)
+
+    def __setattr__(self, key, value):
+        self._values[key] = value
+
+    def __delattr__(self, key):
+        self._values.pop(key, None)
+
+    def all(self):
+        return self._values.items()
+
+
+class Attributes(object):
+    """
+    obj.attributes, over the same values as obj.db.
+    """
+    def __init__(self, values):
+        self._values = values
+
+    def get(self, key, default=None):
+        value = self._values.get(key)
+        return default if value is None else value
+
+    def add(self, key, value):
+        self._values[key] = value
+
+    def has(self, key):
+        return key in self._values
+
+    def remove(self, key):
+        self._values.pop(key, None)
+
+
+class Nothing(object):
+    """
+    cmdset, locks, permissions and scripts: every call does nothing.
+    """
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+_NOTHING = Nothing()
+
+
+class Object(object):
+    """
+    DefaultObject and friends.
+    """
+    def __init__(self, key="", location=None):
+        stage = _STAGE["stage"]
+        self.id = self.pk = next(stage._ids)
+        self.dbref = "#%d" % self.id
+        self.key = key
+        self._attributes = {}
+        self.db = Holder(self._attributes)
+        self.attributes = Attributes(self._attributes)
+        self.ndb = Holder()
+        self.location = location
+        self.home = None
+        self.destination = None
+        self.has_player = False
+        self.contents = []
+        self.cmdset = self.locks = self.permissions = self.scripts = _NOTHING
+        stage.objects[self.id] = self
+        if location is not None:
+            location.contents.append(self)
+
+    @property
+    def name(self):
+        return self.key
+
+    def __str__(self):
+        return self.key
+
+    def __repr__(self):
+        return "<%s %s>" % (self.key, self.dbref)
+
+    def is_typeclass(self, typeclass, exact=False):
+        return inherits_from(self, typeclass)
+
+    def msg(self, text=None, **kwargs):
+        _STAGE["stage"].messages += 1
+
+    def msg_contents(self, text=None, exclude=None, **kwargs):
+        exclude = exclude if isinstance(exclude, (list, tuple)) else [exclude]
+        for obj in self.contents:
+            if obj not in exclude:
+                obj.msg(text)
+
+    def move_to(self, destination, quiet=False, **kwargs):
+        source = self.location
+        if not quiet:
+            self.announce_move_from(destination)
+        if source is not None:
+            source.contents.remove(self)
+            source.at_object_leave(self, destination)
+        self.location = destination
+        if destination is not None:
+            destination.contents.append(self)
+        if not quiet:
+            self.announce_move_to(source)
+        if destination is not None:
+            destination.at_object_receive(self, source)
+        self.at_after_move(source)
+        return True
+
+    def delete(self):
+        if self.at_object_delete() is False:
+            return False
+        if self.location is not None and self in self.location.contents:
+            self.location.contents.remove(self)
+        _STAGE["stage"].objects.pop(self.id, None)
+        self.pk = None
+        return True
+
+    def at_look(self, target):
+        return target.return_appearance(self)
+
+    def return_appearance(self, looker):
+        return self.key
+
+    def get_display_name(self, looker, **kwargs):
+        return self.key
+
+    def access(self, accessing_obj, access_type="read", default=False):
+        return True
+
+    def check_permstring(self, permstring):
+        return False
+
+    def at_object_creation(self):
+        pass
+
+    def at_object_delete(self):
+        return True
+
+    def at_object_receive(self, moved_obj, source_location):
+        pass
+
+    def at_object_leave(self, moved_obj, target_location):
+        pass
+
+    def at_after_move(self, source_location):
+        pass
+
+    def announce_move_from(self, destination):
+        pass
+
+    def announce_move_to(self, source_location):
+        pass
+
+
+class Script(Object):
+    """
+    DefaultScript: no timer, start and stop only call the hooks.
+    """
+    def start(self):
+        self.at_start()
+
+    def stop(self):
+        self.at_stop()
+        self.delete()
+
+    def at_script_creation(self):
+        pass
+
+    def at_start(self):
+        pass
+
+    def at_stop(self):
+        pass
+
+
+class Command(object):
+    """
+    Command and the default commands; never run here.
+    """
+
+
+class CmdSet(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def add(self, *args, **kwargs):
+        pass
+
+
+class Tickers(object):
+    """
+    TICKER_HANDLER: callbacks every interval seconds of the stage clock.
+    """
+    def add(self, interval, callback, idstring="", persistent=True, *args,
+            **kwargs):
+        _STAGE["stage"].add_ticker(interval, callback, idstring)
+
+    def remove(self, interval, callback, idstring="", *args, **kwargs):
+        _STAGE["stage"].remove_ticker(interval, callback, idstring)
+
+
+def inherits_from(obj, parent):
+    '''
+    True if obj is, or is a subclass of, parent: a class or a dotted path
+    like "typeclasses.rooms.DynamicRoom" or "rooms.DynamicRoom".
+    '''
+    cls = obj if isinstance(obj, type) else type(obj)
+    if isinstance(parent, type):
+        return issubclass(cls, parent)
+    for base in cls.__mro__:
+        path = "%s.%s" % (base.__module__, base.__name__)
+        if path == parent or path.endswith("." + parent):
+            return True
+    return False
+
+
+def create_object(typeclass=None, key=None, location=None, home=None,
+                  destination=None, **kwargs):
+    obj = _typeclass(typeclass, Object)(key or "Object", location)
+    obj.home = home
+    obj.destination = destination
+    obj.at_object_creation()
+    return obj
+
+
+def create_script(typeclass=None, key=None, obj=None, **kwargs):
+    script = _typeclass(typeclass, Script)(key or "Script")
+    script.obj = obj
+    script.at_script_creation()
+    script.start()
+    return script
+
+
+def search_object_attribute(key=None, value=None, **kwargs):
+    return [obj for obj in _STAGE["stage"].objects.values()
+            if key in obj._attributes and
+            (value is None or obj._attributes[key] == value)]
+
+
+def search_script(key):
+    return [obj for obj in _STAGE["stage"].objects.values()
+            if isinstance(obj, Script) and obj.key == key]
+
+
+def install(**settings):
+    '''
+    Put the stand-ins in sys.modules and return the Stage. settings become
+    django.conf.settings, GAME_DIR included. Call it once, before anything
+    imports Evennia.
+    '''
+    if _STAGE["stage"] is not None:
+        return _STAGE["stage"]
+    if "evennia" in sys.modules:
+        raise RuntimeError("Evennia is imported already, the stage has to "
+                           "be installed first.")
+    stage = _STAGE["stage"] = Stage()
+    settings.setdefault("GAME_DIR", GAME_DIR)
+    settings.setdefault("TYPECLASS_PATHS", TYPECLASS_PATHS)
+
+    def module(name, **attributes):
+        new = types.ModuleType(name)
+        new.__dict__.update(attributes)
+        sys.modules[name] = new
+        return new
+
+    @contextmanager
+    def atomic():
+        yield
+
+    def log(level):
+        def write(text="", *args, **kwargs):
+            stage.log.append((level, text))
+            if level in ("error", "trace"):
+                sys.stderr.write("%s: %s\n" % (level, text))
+        return write
+
+    module("django", conf=module("django.conf",
+                                 settings=type("Settings", (object,),
+                                               settings)()),
+           db=module("django.db", transaction=module(
+               "django.db.transaction", atomic=atomic)))
+    reactor = module("twisted.internet.reactor",
+                     callLater=stage.call_later,
+                     seconds=lambda: stage.now)
+    module("twisted", internet=module("twisted.internet", reactor=reactor))
+    utils = module(
+        "evennia.utils", inherits_from=inherits_from,
+        gametime=module("evennia.utils.gametime",
+                        runtime=lambda: stage.now),
+        search=module("evennia.utils.search",
+                      search_object_attribute=search_object_attribute,
+                      search_script=search_script),
+        create=module("evennia.utils.create", create_object=create_object,
+                      create_script=create_script),
+        logger=module("evennia.utils.logger", log_info=log("info"),
+                      log_warn=log("warning"), log_err=log("error"),
+                      log_trace=log("trace"), log_file=log("file")))
+    default_cmds = module("evennia.default_cmds", MuxCommand=Command,
+                          CmdLook=Command, CharacterCmdSet=CmdSet,
+                          PlayerCmdSet=CmdSet, UnloggedinCmdSet=CmdSet,
+                          SessionCmdSet=CmdSet)
+    module("evennia", utils=utils, default_cmds=default_cmds,
+           DefaultObject=Object, DefaultRoom=Object, DefaultExit=Object,
+           DefaultCharacter=Object, DefaultScript=Script, Command=Command,
+           CmdSet=CmdSet, TICKER_HANDLER=Tickers(),
+           create_object=create_object, create_script=create_script)
+    if GAME_DIR not in sys.path:
+        sys.path.insert(0, GAME_DIR)
+    return stage
+
+
+def _typeclass(typeclass, default):
+    '''
+    The class for a typeclass path, looked up like Evennia does, or class.
+    '''
+    if typeclass is None:
+        return default
+    if isinstance(typeclass, type):
+        return typeclass
+    paths = [typeclass] + ["%s.%s" % (prefix, typeclass)
+                           for prefix in TYPECLASS_PATHS]
+    for path in paths:
+        module, _, name = path.rpartition(".")
+        try:
+            return getattr(importlib.import_module(module), name)
+        except (ImportError, AttributeError, ValueError):
+            continue
+    raise ImportError("No typeclass %s." % typeclass)
+
+# last line
@@ -9,8 +9,9 @@ Stage one: simply modify @tunnel and @dig to require coordinates
 """
 
 from django.conf import settings
-from evennia.utils import create, search
+from evennia.utils import create
 from commands.command import MuxCommand
+from world import atlas, metrics, weather
 # from world.globe import COMPASS_ROSE
 
 
@@ -69,9 +70,8 @@ class CmdRaise(MuxCommand):
         # convert coordinates to int
         coordinates = (int(lat), int(lon))
 
-        # search for matching coordinates in db
-        conflict = search.search_object_attribute(key="coordinates",
-                                                  value=coordinates)
+        # look for matching coordinates in the atlas
+        conflict = atlas.rooms_at(coordinates)
         if conflict:
             report = "There is already a room at %s: %s"
             report += "\n%s is accessible as %s"
@@ -99,7 +99,7 @@ class CmdRaise(MuxCommand):
 
         new_room = create.create_object(typeclass, room, report_to=caller)
         new_room.locks.add(lockstring)
-        new_room.db.coordinates = coordinates  # save those coordinates
+        atlas.set_coordinates(new_room, coordinates)  # save & index them
         room_string = "Created room %s(%s) of type %s." % (new_room,
                                                            new_room.dbref,
                                                            typeclass)
@@ -168,7 +168,7 @@ class CmdWalk(MuxCommand):
     def func(self):
         caller = self.caller
         location = caller.location
-        old_coord = location.db.coordinates  # lat,lon of starting room
+        old_coord = atlas.coordinates(location)  # lat,lon of starting room
         if not old_coord:
             string = ("%s has no coordinates we cannot use 'walk' from here")
             string = string % location
@@ -201,9 +201,8 @@ class CmdWalk(MuxCommand):
         new_coord = (old_coord[0] + vector[0],
                      old_coord[1] + vector[1])
 
-        # search for matching coordinates in db
-        conflict = search.search_object_attribute(key="coordinates",
-                                                  value=new_coord)
+        # look for matching coordinates in the atlas
+        conflict = atlas.rooms_at(new_coord)
         if conflict:
             report = "There is already a room at %s: %s"
             report += "\n%s is accessible as %s"
@@ -246,7 +245,7 @@ class CmdWalk(MuxCommand):
         new_room.locks.add(lockstring)
 
         # add the coordinates
-        new_room.db.coordinates = new_coord
+        atlas.set_coordinates(new_room, new_coord)
 
         room_string = "Created room %s(%s) of type %s." % (
             new_room, new_room.dbref, typeclass_path)
@@ -307,28 +306,24 @@ class CmdWind(MuxCommand):
     locks = "perm(Builders)"
 
     def func(self):
-        matches = search.search_script("WorldWind")
-        print "\nmatches = %s, type = %s" % (matches, type(matches))
-        if not matches:
-            print "No match in the db for WorldWind.\n"
+        if weather.world_wind() is None:
+            self.caller.msg("No match in the db for WorldWind.")
             return
-        WorldWind = matches[0]
-        print "WorldWind type = %s\n\n" % type(WorldWind)
 
         if not self.args:
-            (direction, speed) = WorldWind.return_wind((1, 1))
-            string = "The wind is blowing %s degrees at %s knots"
+            here = atlas.coordinates(self.caller.location) or (0, 0)
+            (direction, speed) = weather.wind(here)
+            string = "The wind is blowing %.0f degrees at %.1f knots"
             self.caller.msg(string % (direction, speed))
             return
         elif self.switches:
-            print "Do stuff with switches"
+            self.caller.msg("Switches are not supported yet.")
         else:
-            print "This suggests there were some arguments"
             [direction, speed] = self.lhs.split()
             # now set the wind on the object
             string = "You set the wind to %s degrees at %s knots"
             self.caller.msg(string % (direction, speed))
-            WorldWind.set_wind(direction, speed)
+            weather.set_wind(direction, speed)
         # switches:
         # /direction = single arguemnt is a direction
         # /speed = single argument is speed
@@ -352,27 +347,60 @@ class CmdCurrent(MuxCommand):
     locks = "perm(Builders)"
 
     def func(self):
-        matches = search.search_script("WorldWind")
-        print "\nmatches = %s, type = %s" % (matches, type(matches))
-        if not matches:
-            print "No match in the db for WorldWind.\n"
+        if weather.world_wind() is None:
+            self.caller.msg("No match in the db for WorldWind.")
             return
-        WorldWind = matches[0]
-        print "WorldWind type = %s\n\n" % type(WorldWind)
 
         if not self.args:
-            (direction, speed) = WorldWind.return_current((1, 1))
-            string = "The current is flowing %s degrees at %s knots"
+            here = atlas.coordinates(self.caller.location) or (0, 0)
+            (direction, speed) = weather.current(here)
+            string = "The current is flowing %.0f degrees at %.1f knots"
             self.caller.msg(string % (direction, speed))
             return
         elif self.switches:
-            print "Do stuff with switches"
+            self.caller.msg("Switches are not supported yet.")
         else:
-            print "This suggests there were some arguments"
             [direction, speed] = self.lhs.split()
             # now set the wind on the object
             string = "You set the current to %s degrees at %s knots"
             self.caller.msg(string % (direction, speed))
-            WorldWind.set_current(direction, speed)
+            weather.set_current(direction, speed)
+
+
+class CmdMetrics(MuxCommand):
+    """
+    Show where simulation time goes: counters and timers of the fleet,
+    navigation, sighting and messaging stages, see world/metrics.py.
+
+    usage: @metrics[/switch]
+
+    Switches:
+        on     - start collecting, from zero
+        off    - stop collecting, keeping what was collected
+        reset  - start again from zero
+        log    - write the report to the server log as well
+    """
+    key = "@metrics"
+    aliases = ["@stats", ]
+    help_category = "Admin"
+    locks = "cmd:perm(Wizards)"
+
+    def func(self):
+        caller = self.caller
+        if "on" in self.switches:
+            metrics.enable()
+            caller.msg("Collecting metrics.")
+            return
+        if "off" in self.switches:
+            metrics.enable(False)
+            caller.msg("Stopped collecting metrics.")
+        if "reset" in self.switches:
+            metrics.reset()
+            caller.msg("Metrics reset.")
+            return
+        if "log" in self.switches:
+            metrics.dump()
+            caller.msg("Metrics written to the server log.")
+        caller.msg("\n".join(metrics.report()))
 
 # Last line
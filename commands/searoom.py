@@ -1,7 +1,7 @@
 # Sea Room Commands and Command Sets
 
 from evennia import CmdSet, Command
-from evennia.utils import search
+from world import atlas
 # from evennia.utils import inherits_from
 # from evennia.utils.create import create_object
 import re
@@ -32,16 +32,13 @@ class CmdFix(Command):
             "Ask the globe module to look in the atlas:"
             position = self.args
             if not position:
-                print "usage: fix <x,y>"
+                self.caller.msg("usage: fix <x,y>")
                 return
-            print position, type(position)
             # must send a tuple to the globe module
             position = map(int, position.split(','))
             position = tuple(position)
-            # "Find the room by searching the DB for an object"
-            # "With the correct position attribute."
-            room = search.search_object_attribute(key="coordinates",
-                                                  value=position)
+            # "Find the room by looking it up in the atlas"
+            room = atlas.rooms_at(position)
             self.caller.msg(room)
 
 
@@ -84,7 +81,6 @@ class CmdSetPosition(Command):
             # coordinates come in as a string
             coordinates = map(int, coordinates.split(','))
             coordinates = tuple(coordinates)
-            print("Position type = %s\n\n" % type(coordinates))
             self.caller.msg("Input pos = %s" % str(coordinates))
             # now convert string to tuple.
 
@@ -116,12 +112,13 @@ class CmdSetPosition(Command):
         # at this point we have a target
 
         if not coordinates:  # nothing to set just display rooms postition
+            coordinates = atlas.coordinates(target)
             caller.msg("Coordinates of %s is %s" % (target.name,
-                                                    target.db.coordinates))
+                                                    coordinates))
         else:  # room target and position both supplied. Time to display.
-            target.db.coordinates = coordinates
+            atlas.set_coordinates(target, coordinates)
             caller.msg("New position of %s is %s" % (target.name,
-                                                     target.db.coordinates))
+                                                     coordinates))
 
 
 class CoastalCmdSet(CmdSet):
@@ -2,7 +2,8 @@
 
 from evennia import default_cmds
 from evennia import CmdSet, Command
-from world.globe import measure, move_vector
+from world.globe import measure, rhumb_vectors
+from world import autopilot, landmask, routing, sighting
 # from evennia import default_cmds
 
 """
@@ -79,7 +80,8 @@ class CmdLookout(default_cmds.CmdLook):
 
         This command is available when you are on a vessel. It will
         describe the boat or boat-section you are in as well as the area
-        the boat is presently passing through.
+        the boat is presently passing through, and give the bearing and
+        range of everything in sight.
         """
         # locks = "cmd:cmdinside()"
         help_category = "Mutinous Commands"
@@ -88,6 +90,8 @@ class CmdLookout(default_cmds.CmdLook):
         def func(self):
             caller = self.caller
             vessel = caller.location
+            if hasattr(vessel, "take_fix"):
+                vessel.take_fix()  # the room may lag the dead reckoning
             outside = vessel.location
             " First copy default look function"
             if not self.args:
@@ -102,6 +106,9 @@ class CmdLookout(default_cmds.CmdLook):
                 caller.msg("You're on the %s" % vessel.key)
                 # caller.msg("Outside you see:")
                 caller.msg(outboard_view)
+                for contact, bearing, distance in sighting.contacts(vessel):
+                    caller.msg("The %s bears %03d, %.1f nautical miles off."
+                               % (contact.key, bearing, distance))
                 # caller.msg("Inside you see:\n")
                 caller.msg(inboard_view)
             else:
@@ -157,7 +164,7 @@ class CmdNorth(Command):
         vector = self.vector
 
         # get position
-        position = vessel.db.position
+        position = vessel.position
         if not position:
             string = ("AVAST! %s lacks a starting position" % vessel)
             string += " navigation impossible!"
@@ -175,7 +182,7 @@ class CmdNorth(Command):
         vessel.msg_contents("New position = %s" % str(position))
 
         # Arrive at
-        self.obj.arrive_at(vessel, position)
+        vessel.arrive_at(position)
 
         # Old arrival Code - now moved to Globe
         '''
@@ -225,7 +232,6 @@ class CmdNorth(Command):
                 vessel.move_to(room)
                 return
             '''
-        print "Something else went wrong"
 
 
 class CmdSouth(CmdNorth):
@@ -282,7 +288,8 @@ class CmdGlobalMeasure(Command):
         measure -42,39 & -2,41
 
     This command lets the user of the conn measure the distance between any two
-    points of latitude and longitude
+    points of latitude and longitude, and the initial great circle bearing
+    from the first to the second.
     """
 
     key = "measure"
@@ -296,42 +303,42 @@ class CmdGlobalMeasure(Command):
         caller = self.caller
         report = caller.msg
         args = self.args
+        self.a = self.b = None
         # report(args)
-        if "&" in self.args:
-            # point_a, point_b = None, None
+        try:
             point_a, point_b = [part.strip() for part in args.split("&")]
-            if not point_a or not point_b:
-                report("Usage: measure lat,long & lat,long")
-                return
-
-            # convert to lists or tuples
+            # convert to tuples of exactly 2 numbers
             a = tuple(map(float, point_a.split(',')))
             b = tuple(map(float, point_b.split(',')))
-            report("Points:  a = %s and b = %s" % (a, b))
-            self.a = a
-            self.b = b
-        else:
+            if len(a) != 2 or len(b) != 2:
+                raise ValueError
+        except ValueError:
             report("Usage: measure lat,long & lat,long")
             return
+        report("Points:  a = %s and b = %s" % (a, b))
+        self.a = a
+        self.b = b
 
     def func(self):
         caller = self.caller
         report = caller.msg
-        # if not self.a or not self.b:
-        #    report("Usage: measure lat,long & lat,long")
-        #    return
+        if not self.a or not self.b:
+            return  # parse has given the usage
         a = self.a
         b = self.b
-        distance = measure(a, b)
-        report("From %s to %s is %s nautical miles" % (a, b, distance))
+        bearing, distance = measure(a, b)
+        report("From %s to %s is %.1f nautical miles, bearing %03d" %
+               (a, b, distance, round(bearing) % 360))
 
 
 # from world.globe import measure, travel
 class CmdTravel(Command):
     """
     Accept an initial heading 3 figure degrees and distance in nautical miles
-    from the conning player.  Then move the vessel that distance following a
-    great circle course.
+    from the conning player.  The vessel steers to that heading and heaves to
+    when it has run that distance holding it, a rhumb line; current and
+    leeway may set it off a little on the way. It has to be under way to
+    get there, row or set sails.
 
     # figure notation means include a 3 digits even if you have to use leading
     zer
@@ -348,7 +355,7 @@ class CmdTravel(Command):
         travel 090 120
 
         Result:
-            The vessel will move 120 nautical miles East and end up at
+            The vessel will head East and stop 120 nautical miles on at
             coordinates: (0N, 2E)
     """
 
@@ -366,23 +373,180 @@ class CmdTravel(Command):
         vessel = caller.location
         report = caller.msg
         heading = int(self.heading)
-        print heading
         distance = float(self.distance)
-        print distance
 
         report("You set a heading of %s, and travel %s nautical miles"
                % (str(heading), str(distance)))
 
-        start_position = (tuple(vessel.db.position))
+        start_position = (tuple(vessel.position))
         # start_position = (0, 0)
         report("given a starting position of %s" % str(start_position))
 
-        final_position = move_vector(start_position, (heading, distance))
+        final_position = tuple(float(part) for part in rhumb_vectors(
+            start_position[0], start_position[1], heading, distance))
 
         report("You will arrive at %s" % str(final_position))
+        ashore = landmask.first_land(start_position, heading, distance)
+        if ashore is not None:
+            report("Land ho! There is land %.1f nautical miles ahead."
+                   % ashore)
+
+        # the navigation schedule stops the vessel there
+        vessel.travel_to(heading, final_position)
+
+
+class CmdRoute(Command):
+    """
+    Work out the fastest route under sail to a point, in the wind and
+    current forecast on the way there, and put it in the log for the
+    helm.
+
+    Usage:
+        route <lat>,<lon>
+        route            (shows the route in the log)
+
+    Example:
+        route 12,-40
+
+    Lists the waypoints: when to be where and the heading to steer from
+    each, and the time it takes. The vessel needs a polar to sail by, and
+    the route is worked out for the sails set now, so set sail first.
+    "autopilot route" then sails it.
+    """
+
+    key = "route"
+    help_category = "Mutinous Commands"
+    aliases = ["plot", ]
+    usage = "route <lat>,<lon>   (help route for details)"
+
+    def func(self):
+        caller = self.caller
+        vessel = caller.location
+        report = caller.msg
+        if not self.args.strip():
+            if not vessel.db.route:
+                report("There is no route in the log.")
+                return
+            self.show(vessel.db.route)
+            return
+        try:
+            destination = tuple(float(part) for part in self.args.split(","))
+            lat, lon = destination
+        except ValueError:
+            report(self.usage)
+            return
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            report("That is not a point on the globe.")
+            return
+        if not vessel.db.polar:
+            report("The %s has no polar to sail by." % vessel.key)
+            return
+        if _lost(vessel):
+            return
+        if not vessel.sails:
+            report("The sails are furled. Set sail to plot a route.")
+            return
+        if landmask.is_land(destination):
+            report("That is on land.")
+            return
+        route = routing.plan(tuple(vessel.position), destination,
+                             vessel.db.polar, sails=vessel.sails)
+        if route is None:
+            report("There is no way there under sail.")
+            return
+        vessel.db.route = route
+        self.show(route)
+
+    def show(self, route):
+        "List the waypoints of route, hours counted from the first."
+        start = route[0][0]
+        lines = ["Route, %d waypoints:" % len(route)]
+        for hour, (lat, lon), heading in route:
+            if heading is None:
+                lines.append("  %6.1fh  %7.2f, %7.2f  arrive" %
+                             (hour - start, lat, lon))
+            else:
+                lines.append("  %6.1fh  %7.2f, %7.2f  steer %03d" %
+                             (hour - start, lat, lon, round(heading) % 360))
+        lines.append("About %.1f hours, %.1f days." %
+                     (route[-1][0] - start, (route[-1][0] - start) / 24.0))
+        self.caller.msg("\n".join(lines))
+
+
+class CmdAutopilot(Command):
+    """
+    Put the vessel on autopilot, to sail from waypoint to waypoint on great
+    circle courses and heave to at the last one.
 
-        # Lets see if arrive at works out of the box:
-        self.obj.arrive_at(vessel, final_position)
+    Usage:
+        autopilot <lat>,<lon> [; <lat>,<lon> ...]
+        autopilot route    (follow the route in the log, see help route)
+        autopilot off
+        autopilot          (where it is heading and when it gets there)
+
+    Example:
+        autopilot 0,2; 1,3.5
+
+    Steering by hand, or travel, takes the vessel off autopilot. The
+    vessel has to be under way to get anywhere, row or set sails.
+    """
+
+    key = "autopilot"
+    help_category = "Mutinous Commands"
+    aliases = ["ap", ]
+    usage = "autopilot <lat>,<lon> [; <lat>,<lon> ...] | route | off"
+
+    def func(self):
+        caller = self.caller
+        vessel = caller.location
+        report = caller.msg
+        args = self.args.strip()
+        if not args:
+            self.status(vessel)
+        elif args == "off":
+            autopilot.disengage(vessel)
+            vessel.msg_contents("The %s is off autopilot." % vessel.key)
+        elif args == "route":
+            if not vessel.db.route:
+                report("There is no route in the log.")
+                return
+            self.engage(vessel, [fix for _, fix, _ in vessel.db.route[1:]])
+        else:
+            try:
+                waypoints = [tuple(float(part) for part in fix.split(","))
+                             for fix in args.split(";")]
+                if any(len(fix) != 2 for fix in waypoints):
+                    raise ValueError
+            except ValueError:
+                report(self.usage)
+                return
+            self.engage(vessel, waypoints)
+
+    def engage(self, vessel, waypoints):
+        "Put vessel on autopilot for waypoints and say so."
+        if not waypoints:
+            self.caller.msg("There are no waypoints to make for.")
+            return
+        if _lost(vessel):
+            return
+        autopilot.engage(vessel, waypoints)
+        vessel.msg_contents("The %s is on autopilot, %d waypoints." %
+                            (vessel.key, len(waypoints)))
+        self.status(vessel)
+
+    def status(self, vessel):
+        "Report the next waypoint and the time to the last."
+        if not autopilot.engaged(vessel):
+            self.caller.msg("The %s is not on autopilot." % vessel.key)
+            return
+        lat, lon = vessel.db.destination
+        hours = autopilot.eta(vessel)
+        if hours is None:
+            eta = "making no way"
+        else:
+            eta = "about %.1f hours to the last" % hours
+        self.caller.msg("Making for %.2f, %.2f, %d waypoints to go, %s." %
+                        (lat, lon, len(vessel.db.waypoints), eta))
 
 
 # script based movement
@@ -410,7 +574,7 @@ class CmdGetUnderway(Command):
 
     def func(self):
         vessel = self.obj.location
-        heading = vessel.db.heading
+        heading = vessel.heading
         if self.args:
             speed = int(self.args)
             "call the get underway function on the vessel object"
@@ -501,7 +665,7 @@ class CmdSteerTo(Command):
             vessel.steer_to(self.heading)
             string = "%s steers the %s to %s!" % (helm, vessel, self.heading)
         else:
-            string = "Current heading: %s" % vessel.db.heading
+            string = "Current heading: %s" % vessel.heading
         vessel.msg_contents(string)
 
 
@@ -524,15 +688,15 @@ class CmdSails(Command):
     def func(self):
         vessel = self.obj.location
         order = self.args.strip()
-        canvas = vessel.db.sails
+        canvas = vessel.sails
         if not order:
             vessel.msg_contents("Sails are at %s" % canvas)
         elif order == "up":
-            vessel.db.sails = 1.0
-            vessel.msg_contents("Sails are at %s" % vessel.db.sails)
+            vessel.sails = 1.0
+            vessel.msg_contents("Sails are at %s" % vessel.sails)
         elif order == "down":
-            vessel.db.sails = 0
-            vessel.msg_contents("Sails are at %s" % vessel.db.sails)
+            vessel.sails = 0
+            vessel.msg_contents("Sails are at %s" % vessel.sails)
         else:
             vessel.msg_contents(self.usage)
 
@@ -563,6 +727,8 @@ class CmdSetConn(CmdSet):
 
     def at_cmdset_creation(self):
         self.add(CmdTravel())
+        self.add(CmdRoute())
+        self.add(CmdAutopilot())
         # I removed the direct movement commands.
         self.add(CmdGetUnderway())
         self.add(CmdHeaveTo())
@@ -583,4 +749,17 @@ class CmdSetVessel(CmdSet):
         self.add(CmdBoard())
         self.add(CmdGlobalMeasure())
         # add the conn command below
+
+
+def _lost(vessel):
+    """
+    Tell everyone aboard and return True if vessel has no position to
+    navigate from.
+    """
+    if vessel.position:
+        return False
+    vessel.msg_contents("AVAST! %s lacks a starting position, navigation "
+                        "impossible!" % vessel)
+    return True
+
 # last line
@@ -22,7 +22,24 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    from world import atlas, fleet, weather, polars, roompool, writeback
+    from world import autopilot, landmask, sighting
+    print "Loaded polars: %s" % polars.load()
+    rooms = atlas.rebuild()
+    print "Atlas indexed %s rooms" % rooms
+    if landmask.load():
+        print "Loaded the coastline land mask"
+    print "Land mask has %s dry land rooms" % landmask.rebuild()
+    print "Room pool has %s free rooms" % roompool.rebuild()
+    floaters = fleet.rebuild()
+    fleet.start()
+    print "Fleet tick started with %s floaters" % floaters
+    print "Autopilot engaged on %s vessels" % autopilot.rebuild()
+    print "Sighting sweep started with %s vessels at anchor" % \
+        sighting.rebuild()
+    sighting.start()
+    weather.start()
+    writeback.start()
 
 
 def at_server_stop():
@@ -30,7 +47,10 @@ def at_server_stop():
     This is called just before the server is shut down, regardless
     of it is for a reload, reset or shutdown.
     """
-    pass
+    from world import metrics, writeback
+    print "Saved the live state of %s objects" % writeback.flush()
+    if metrics.enabled():
+        metrics.dump()
 
 
 def at_server_reload_start():
@@ -29,6 +29,14 @@ from evennia.settings_default import *
 # Mutiny Settings 
 ######################################################################
 IN_GAME_ERRORS = True  # this is for development debugging
+WRITEBACK_INTERVAL = 60  # seconds between saves of live vessel state
+SIGHT_RANGE = 12.0  # nautical miles a crew can see other vessels
+SIGHTING_INTERVAL = 3  # seconds between sweeps for contacts
+SHARE_RADIUS = 1.0  # nautical miles within which vessels share a sea room
+METRICS = False  # collect counters and timers from server start, see @metrics
+MESSAGE_REPEAT = 30  # seconds before a vessel repeats a status line
+ROOM_POOL_SIZE = 100  # free dynamic sea rooms kept for reuse
+LAND_MASK = None  # path of a coastline land mask, see world/landmask.py
 
 
 ######################################################################
@@ -49,6 +49,3 @@ class Exit(DefaultExit):
     def at_failed_traverse(exit, vessel):
         # Tell the occupants of a vessel why move through exit failed.
         vessel.msg_contents("The %s cannot sail on to dry land" % vessel)
-        print "This is where I would put a message to the boat"
-        print "exit = %s" % exit
-        print "vessel = %s" % vessel
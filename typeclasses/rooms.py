@@ -6,6 +6,8 @@ Rooms are simple containers that has no location of their own.
 """
 
 from evennia import DefaultRoom
+from evennia.utils import inherits_from
+from world import atlas, roompool, weather, writeback
 # from evennia import create_script
 # from commands.searoom import CoastalCmdSet
 
@@ -20,7 +22,12 @@ class Room(DefaultRoom):
     See examples/object.py for a list of
     properties and methods available on all Objects.
     """
-    pass
+    def at_object_delete(self):
+        # a deleted room must not be found in the atlas any more
+        atlas.forget(self)
+        roompool.forget(self)
+        writeback.forget(self)
+        return True
 
 
 class Outside(Room):
@@ -32,9 +39,29 @@ class Outside(Room):
     object they receive.
 
     Has wind and weather.
+
+    Vessels look at their room after every move, so the description is
+    cached in ndb.appearances until the contents, the players among them or
+    the weather change. Views differ by who is looking: the looker is left
+    out, and builders see more (see _viewer), so there is one description
+    for each. View locks are taken to depend on permissions only.
     """
     def at_object_receive(self, new_arrival, source_location):
-        new_arrival.db.position = self.db.coordinates
+        self.ndb.appearances = None
+        self.place(new_arrival)
+
+    def at_object_leave(self, moved_obj, target_location):
+        self.ndb.appearances = None
+
+    def place(self, new_arrival):
+        """
+        Give a new arrival the coordinates of the room.
+        """
+        coordinates = atlas.coordinates(self)
+        if inherits_from(new_arrival, "typeclasses.vessel.FloatingObject"):
+            new_arrival.position = coordinates  # written behind
+        else:
+            new_arrival.db.position = coordinates
 
     def return_appearance(self, looker):
         """
@@ -46,6 +73,24 @@ class Outside(Room):
         """
         if not looker:
             return
+        version = weather.version()
+        cache = self.ndb.appearances
+        if cache is None or cache[0] != version:
+            cache = self.ndb.appearances = (version, {})
+        wind = self.db.wind
+        # puppeting moves nothing in or out, so who is a player is keyed too
+        players = tuple(con.id for con in self.contents if con.has_player)
+        key = (self.key, self.db.desc, wind and tuple(wind), _viewer(looker),
+               looker.id if looker.location == self else None, players)
+        string = cache[1].get(key)
+        if string is None:
+            string = cache[1][key] = self._appearance(looker)
+        return string
+
+    def _appearance(self, looker):
+        """
+        Build the description for looker, see return_appearance.
+        """
         # get and identify all objects
         visible = (con for con in self.contents if con != looker and
                    con.access(looker, "view"))
@@ -83,39 +128,26 @@ class DynamicRoom(SeaRoom):
     Probably all the action should take place here. That is the DSR is the only
     room that players should ever see.  So for instance the command sets should
     apply here etc.
-    '''
 
+    Dynamic rooms come from the room pool (see world/roompool.py) and go
+    back to it as soon as the last occupant leaves. Floaters close to each
+    other share one (see world/navigation.py), so a floater coming in
+    keeps its own position rather than the room's.
     '''
-    def at_object_leave(self, moved_obj, target_location):
-        This function was set up to handle deletion of temporary rooms when no
-        longer needed.  not
-        print "%s left" % moved_obj
-        # if moved_obj was a vessel
-        if not moved_obj.is_typeclass("typeclasses.vessel.VesselObject"):
-            print "not a vessel though so no worries"
+    def place(self, new_arrival):
+        if (inherits_from(new_arrival, "typeclasses.vessel.FloatingObject")
+                and new_arrival.fix):
             return
+        super(DynamicRoom, self).place(new_arrival)
+
+    def at_object_leave(self, moved_obj, target_location):
+        super(DynamicRoom, self).at_object_leave(moved_obj, target_location)
+        roompool.release(self, leaving=moved_obj)
 
-        # then search contents of room for any other vessels
-        print "Remaining objects: "
-        # print self.contents
-        vessel_count = 0
-        for floater in self.contents:
-            print floater
-            if floater.is_typeclass("typeclasses.vessel.VesselObject"):
-                vessel_count = vessel_count + 1
-        print "vessel count = %s" % vessel_count
-        # if any vessels remain, then return
-        if vessel_count > 1:
-            return
-        else:
-            # if none, then add the script
-            self.scripts.add("typeclasses.scripts.CleanSeaRoom")
-    '''
     def at_server_reload(self):
-        # this cleans up extra dyanmic rooms if they are not being used.
-        if not self.contents:
-            print "Cleaning up empty dynamic room"
-            self.delete()
+        # empty dynamic rooms left over go to the pool, or are deleted
+        if not self.contents and not self.db.pooled:
+            roompool.release(self)
 
 
 # Coastal Rooms
@@ -138,4 +170,14 @@ class CoastalRoom(SeaRoom):
 # Dry land
 class DryLandRoom(Outside):
     pass
+
+
+def _viewer(looker):
+    """
+    The kind of viewer looker is: builders see object numbers in names.
+    """
+    if looker.check_permstring("Builders"):
+        return "builder"
+    return "player"
+
 # Last line
@@ -13,6 +13,9 @@ just overloads its hooks to have it perform its function.
 """
 
 from evennia import DefaultScript
+from world import weather
+from world.fields import VectorField, WeatherTimeline
+from world.weather_archive import WeatherArchive
 
 
 class Script(DefaultScript):
@@ -144,7 +147,8 @@ class VesselMove(Script):
 class WorldWind(Script):
     '''
     This script is an in game object that stores the current wind speed and
-    direction.  Presently one wind for the whole world.
+    direction.  Either one wind for the whole world or a gridded field
+    of regional winds, and the same for the current.
     One purpose of this script is to allow me to change the wind in game to
     test other physics.
     The plan is to create a single script from this typeclass at_initial_setup
@@ -158,15 +162,103 @@ class WorldWind(Script):
         self.interval = 0
         self.persistent = True
 
+    def at_start(self):
+        # a (re)started script is a new handle for the weather service
+        weather.invalidate()
+
+    def at_stop(self):
+        weather.invalidate()
+
+    def at_server_reload(self):
+        weather.invalidate()
+
     def return_wind(self, position):
-        return self.db.wind
+        return self.wind_field().vector(position)
 
     def return_current(self, position):
-        return self.db.current
+        return self.current_field().vector(position)
+
+    def return_winds(self, lats, lons):
+        return self.wind_field().vectors(lats, lons)
+
+    def return_currents(self, lats, lons):
+        return self.current_field().vectors(lats, lons)
+
+    def wind_field(self):
+        '''
+        The wind as a VectorField: the gridded field if one was set,
+        otherwise the one global wind. Unpacked once and kept in ndb.
+        '''
+        if not self.ndb.wind_field:
+            self.ndb.wind_field = self._field(self.db.wind_field,
+                                              self.db.wind)
+        return self.ndb.wind_field
+
+    def current_field(self):
+        '''
+        The current as a VectorField, see wind_field.
+        '''
+        if not self.ndb.current_field:
+            self.ndb.current_field = self._field(self.db.current_field,
+                                                 self.db.current)
+        return self.ndb.current_field
+
+    def timeline(self):
+        '''
+        The weather over time: the WeatherArchive at db.archive if one is
+        set, else the WeatherTimeline built from db.timeline, else None.
+        Opened or unpacked once and kept in ndb.
+        '''
+        if self.db.archive:
+            if not self.ndb.timeline:
+                self.ndb.timeline = WeatherArchive(self.db.archive)
+            return self.ndb.timeline
+        if not self.db.timeline:
+            return None
+        if not self.ndb.timeline:
+            keyframes = [(hour, VectorField.unpack(wind),
+                          VectorField.unpack(current))
+                         for hour, wind, current in self.db.timeline]
+            self.ndb.timeline = WeatherTimeline(keyframes)
+        return self.ndb.timeline
+
+    def add_keyframe(self, hour, wind_field, current_field):
+        keyframes = list(self.db.timeline or [])
+        keyframes.append((float(hour), wind_field.pack(),
+                          current_field.pack()))
+        self.db.timeline = keyframes
+        self.ndb.timeline = None
+
+    def set_archive(self, path):
+        self.db.archive = path
+        self.ndb.timeline = None
+
+    def clear_timeline(self):
+        self.db.timeline = None
+        self.db.archive = None
+        self.ndb.timeline = None
+
+    def _field(self, packed, vector):
+        if packed:
+            return VectorField.unpack(packed)
+        return VectorField.uniform(*vector)
 
     def set_wind(self, direction, speed):
+        # one global wind replaces any gridded wind
         self.db.wind = (float(direction), float(speed))
+        self.db.wind_field = None
+        self.ndb.wind_field = None
 
     def set_current(self, direction, speed):
         self.db.current = (float(direction), float(speed))
+        self.db.current_field = None
+        self.ndb.current_field = None
+
+    def set_wind_field(self, field):
+        self.db.wind_field = field.pack()
+        self.ndb.wind_field = None
+
+    def set_current_field(self, field):
+        self.db.current_field = field.pack()
+        self.ndb.current_field = None
 # Last Line
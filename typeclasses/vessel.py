@@ -1,13 +1,14 @@
 # VESSELS - Boats etc.
 
-import math
 from evennia import DefaultObject
-from evennia.utils import search, inherits_from
-from evennia.utils.create import create_object
+from evennia.utils import inherits_from
 from commands.vessel import CmdSetVessel, CmdSetOnboard, CmdSetConn
 # from evennia import utils
-from world.globe import add_vector, move_vector, get_weather
-from evennia import TICKER_HANDLER as tickerhandler
+from world.globe import measure, move_vector, rhumb_vectors
+from world import atlas, clock, fleet, landmask, navigation, roompool
+from world import autopilot, bulletin, metrics, sailing, sighting
+from world import writeback
+from world.writeback import LiveAttribute
 
 
 class FloatingObject(DefaultObject):
@@ -15,11 +16,175 @@ class FloatingObject(DefaultObject):
     The floating object as a base for vessels etc.
     Floating objects can be adrift or anchored. If adrift, they will move every
     tick.
+    Position, heading, power and sails change all the time so they are held
+    in memory and written behind to the database, see world/writeback.py.
+
+    A floater adrift is dead reckoned: it keeps its last fix and a segment,
+    (hour, course, speed), and its position is worked out from those
+    whenever it is asked for. The fleet sets a new course when the weather
+    or the steerage changes, see world/fleet.py, and the navigation
+    schedule wakes the floater when something happens on the way, see
+    world/navigation.py.
     '''
+    fix = LiveAttribute("position")  # where the segment starts
+    # (hour, course, speed) from the fix
+    segment = LiveAttribute("segment", None, "at_course_change")
+    heading = LiveAttribute("heading", 0.0, "at_steerage_change")
+    power = LiveAttribute("power", 0.0, "at_steerage_change")
+    sails = LiveAttribute("sails", 0.0, "at_steerage_change")
+
+    @property
+    def position(self):
+        '''
+        Where the floater is now, by dead reckoning.
+        '''
+        return self.position_at(clock.now())
+
+    @position.setter
+    def position(self, position):
+        '''
+        Put the floater at position; it carries on from there on the same
+        course.
+        '''
+        segment = self.segment
+        self.fix = position
+        if segment:
+            self.segment = (clock.now(), segment[1], segment[2])
+        elif self.db.adrift:
+            fleet.plan([self])
+
+    def position_at(self, hour, decimals=2):
+        '''
+        Dead reckoning position at simulation hour.
+        '''
+        fix = self.fix
+        if not fix:
+            return fix
+        start, course, speed = self.segment or (hour, 0.0, 0.0)
+        lat, lon = rhumb_vectors(fix[0], fix[1], course,
+                                 speed * max(hour - start, 0.0), decimals)
+        return (float(lat), float(lon))
+
+    def set_course(self, course, speed, fix=None, hour=None):
+        '''
+        Start a new segment at course and speed over ground from fix at
+        hour, by default from wherever the floater is now.
+        '''
+        if hour is None:
+            hour = clock.now()
+        if fix is None:
+            fix = self.position_at(hour, decimals=None)
+        self.fix = fix
+        self.segment = (hour, course, speed)
+
+    def take_fix(self):
+        '''
+        Bring the room up to date with the dead reckoning position, e.g.
+        before looking around. Between fixes a floater at sea keeps the
+        room it had, and a sea room goes along with it unless there is a
+        fixed room where it is now.
+        '''
+        position = self.position
+        location = self.location
+        if not position or not location:
+            return position
+        room = atlas.room_at(position)
+        if room is location:
+            return position
+        if navigation.at_sea(location) and (room is None or
+                                            navigation.at_sea(room)):
+            atlas.set_coordinates(location, position, defer=True)
+        else:
+            self.arrive_at(position)
+        return position
+
+    def join(self, other):
+        '''
+        Come into the sea room of another floater close by, see
+        world/navigation.py.
+        '''
+        self.report("The %s comes up with the %s.", self.key, other.key)
+        metrics.count("vessel.move_to")
+        self.move_to(other.location)
+
+    def part_company(self):
+        '''
+        Leave a shared sea room for one of our own once the others are out
+        of hail.
+        '''
+        self.report("The %s parts company.", self.key)
+        metrics.count("vessel.move_to")
+        self.move_to(roompool.acquire(self.position))
+
+    def run_aground(self, hour=None):
+        '''
+        Stop short of dry land: back to where the floater was a tick ago and
+        no more way until the course changes.
+        '''
+        segment = self.segment
+        if not segment:
+            return
+        if hour is None:
+            hour = clock.now()
+        self.set_course(segment[1], 0.0,
+                        fix=self.position_at(max(segment[0], hour - 1),
+                                             decimals=None),
+                        hour=hour)
+        self.report("The %s runs aground!", self.key)
+
+    def report(self, text, *args):
+        '''
+        Tell everyone aboard how things stand, text % args. Reports are
+        sent together after each event and not repeated for a while, see
+        world/bulletin.py.
+        '''
+        bulletin.post(self, text, *args)
+
+    def at_course_change(self):
+        '''
+        Called on every new segment: the navigation schedule works out
+        what happens next.
+        '''
+        if self.db.adrift:
+            navigation.expect(self)
+
+    def at_destination(self):
+        '''
+        Called by the navigation schedule when the floater gets to
+        db.destination.
+        '''
+        self.db.destination = None
+        self.db.tolerance = None
+        self.report("The %s has arrived.", self.key)
+
+    def at_meeting(self, other):
+        '''
+        Called by the navigation schedule when another floater comes close.
+        Whoever watches the other floater can see this one now.
+        '''
+        self.report("The %s is close by.", other.key)
+        if other.ndb.observed and not self.ndb.observed:
+            fleet.attend(self)
+
+    def at_steerage_change(self):
+        '''
+        Called when heading, power or sails change: a new course right away.
+        '''
+        if self.db.adrift:
+            fleet.plan([self])
+
     def at_object_creation(self):
         self.cast_off()
         self.db.windage = 0.1  # default windage
 
+    def at_object_delete(self):
+        fleet.recall(self)
+        sighting.forget(self)
+        autopilot.forget(self)
+        bulletin.forget(self)
+        writeback.forget(self)
+        return True
+
     def cast_off(self):
         '''
         When cast_off, a vessel is subject to movement forces. Current, wind,
@@ -28,32 +193,41 @@ class FloatingObject(DefaultObject):
         '''
         self.db.adrift = True
         self.msg_contents("The %s is now adrift." % self.key)
-        tickerhandler.add(3, self.make_way, idstring="adrift")
-        # updates postion
+        sighting.forget(self)
+        fleet.launch(self)
+        fleet.plan([self])
+        # the fleet tick updates postion
 
     def anchor(self):
-        tickerhandler.remove(3, self.make_way, idstring="adrift")
-        self.db.power = 0
+        self.take_fix()
+        fleet.recall(self)
+        sighting.moor(self)
         self.db.underway = False
         self.db.adrift = False
+        self.set_course(0.0, 0.0)  # hold the fix
+        self.power = 0
 
     def make_way(self):
         '''
         move in response to impelling forces:
         wind, current, and power
-        on a bare floating object this is purely based on wind and current
-        a floater doesn't have a heading and never has power.
-        '''
-        # Could get wind and current here
-        (wind, current) = get_weather(self.db.position)
-        print "wind: %s" % str(wind)
-        print "current: %s" % str(current)
-        # then calculate actual course here.
-        wind[1] = wind[1] * self.windage  # reduces wind effect to a fraction
-        course = add_vector(wind, current)
-        position = move_vector(self.db.position, course)
-        self.arrive_at(position)
+        The fleet normally does this for every floater at once, this just
+        works out the course for this one object and takes a fix.
+        '''
+        fleet.plan([self])
+        self.take_fix()
+
+    def steerage(self):
+        '''
+        Return (heading, power, sails, windage, polar) for the fleet, which
+        turns them and the weather into forces for every floater at once.
+        On a bare floating object this is purely based on wind and current
+        a floater doesn't have a heading, sails or power.
+        '''
+        windage = self.db.windage or 0.1  # reduces wind effect to a fraction
+        return (0.0, 0.0, 0.0, windage, None)
 
+    @metrics.timed("vessel.arrive_at")
     def arrive_at(self, position):
         '''
         # The following code moves an object to a new position and room that
@@ -64,54 +238,55 @@ class FloatingObject(DefaultObject):
         # Check the arguments to make sure vessel is a vessel and
         # position is a position
 
-        # Look up room in teh entier DB
+        # Look up room in the atlas
         if position:
-            room = search.search_object_attribute(key="coordinates",
-                                                  value=position)
+            room = atlas.room_at(position)
         else:
             string = "position: %s" % str(position)
             self.msg_contents(string)
             return
+        # no jumping across land on the way, see world/landmask.py
+        start = vessel.position
+        if start and landmask.blocked(start, position):
+            vessel.report("There's land in the way so cancelling move.")
+            return
         # move to room
         if room:
             # If the destination room exists, we go there.
-            vessel.msg_contents("%s already exists." % room)
-            room = room[0]
-            # TODO: fix this^ throw on multimatch rooms there should only
-            # ever be one room per coordinates
-            # unless it is dry land
+            vessel.report("%s already exists.", room)
+            # the atlas prefers dry land on multimatch rooms
             if inherits_from(room, "typeclasses.rooms.DryLandRoom"):
-                vessel.msg_contents("It's dry land so cancelling move.")
+                vessel.report("It's dry land so cancelling move.")
                 return
             # but if not dry land
             # ... lets get on with it and move
             else:
-                vessel.msg_contents("Moving to %s" % room)
+                vessel.report("Moving to %s", room)
+                metrics.count("vessel.move_to")
                 vessel.move_to(room)
                 return
         elif (vessel.location.is_typeclass("rooms.DynamicRoom") and
                 len(vessel.location.contents) == 1):
             # This means we are in a dynamic room alone
-            vessel.msg_contents("updating room coordinates to %s"
-                                % str(position))
-            vessel.location.db.coordinates = position
-            # have to update vessel position to match rooms new position
-            vessel.db.position = position
+            vessel.report("updating room coordinates to %s", str(position))
+            atlas.set_coordinates(vessel.location, position, defer=True)
+            # have to update vessel position to match rooms new position,
+            # unless dead reckoning has it there already: the rounded fix
+            # would set it back along its track
+            if atlas.quantize(position) != atlas.quantize(vessel.position):
+                vessel.position = position
             return
         else:  # Assume the current room is occupied or not dynamic
             # create the room
-            vessel.msg_contents("Creating new room at %s" % str(position))
-            room = create_object(typeclass="rooms.DynamicRoom",
-                                 key="The Open Ocean",
-                                 location=None,
-                                 )
-            room.db.coordinates = position
-            vessel.msg_contents("Moving to %s" % room)
+            vessel.report("Creating new room at %s", str(position))
+            room = roompool.acquire(position)
+            vessel.report("Moving to %s", room)
+            metrics.count("vessel.move_to")
             vessel.move_to(room)
             return
 
         def make_way(self, course):
-            old_position = self.db.position
+            old_position = self.position
             position = move_vector(old_position, course)
             self.msg_contents("New position = %s" % str(position))
             self.arrive_at(self, position)
@@ -136,7 +311,7 @@ class VesselObject(FloatingObject):
     def at_object_creation(self):
         self.cmdset.add_default(CmdSetVessel)
         self.db.underway = False
-        self.db.heading = 0
+        self.heading = 0
         self.permissions.add("vessel")
 
     def announce_move_from(self, destination):
@@ -188,19 +363,19 @@ class VesselObject(FloatingObject):
         announce the view to the contents of the room.
 
         """
-        self.msg_contents(self.at_look(self.location))
+        if bulletin.listening(self):
+            self.report(self.at_look(self.location))
 
     def at_object_receive(self, moved_obj, source_location):
         if moved_obj.is_typeclass("characters.Character"):
             # only pc or npcs can have these commands
             moved_obj.cmdset.add(CmdSetOnboard, permanent=True)
-            print "Adding Onboard commands to %s" % moved_obj
+        if moved_obj.has_player:
+            fleet.attend(self)  # someone to see where we are going
 
     def at_object_leave(self, moved_obj, target_location):
         moved_obj.cmdset.delete(CmdSetOnboard)
-        print "Deleting Onboard commands from %s" % moved_obj
         moved_obj.cmdset.delete(CmdSetConn)
-        print "Deleting Conning commands from %s" % moved_obj
 
     def return_view(self):
         """
@@ -217,80 +392,73 @@ class VesselObject(FloatingObject):
         '''
         This changes the objects heading
         I guess this is called by a players command. Not sure whether it makes
-        sense here.
+        sense here. Steering by hand takes the vessel off autopilot.
         '''
-        self.db.heading = float(heading)
+        autopilot.disengage(self)
+        self.heading = float(heading)
         string = "The %s steers to %s degrees"
         self.msg_contents(string % (self.key, heading))
 
+    def heave_to(self):
+        '''
+        Stop rowing and take in the sails. The vessel still drifts.
+        '''
+        self.db.underway = False
+        self.power = 0.0
+        self.sails = 0.0
+
+    def travel_to(self, heading, destination):
+        '''
+        Steer to heading and heave to on reaching destination, or the
+        closest the vessel gets to it if current and leeway set it off.
+        '''
+        self.steer_to(heading)
+        self.db.destination = destination
+        self.db.tolerance = navigation.OFFSET * measure(self.position,
+                                                        destination)[1]
+        if self.db.adrift:
+            navigation.expect(self)
+
+    def at_destination(self):
+        if autopilot.arrived(self):
+            return  # on to the next waypoint
+        super(VesselObject, self).at_destination()
+        self.heave_to()
+
     def get_underway(self, power):
         '''
         Get going, rowing maybe?
         '''
-        self.db.power = float(power)
+        self.power = float(power)
         self.db.underway = True
         if not self.db.adrift:
             self.cast_off()
 
-    def make_way(self):  # over ride the floating objects make_way
+    def steerage(self):  # over ride the floating objects steerage
         '''
-        move in response to impelling forces:
-        wind, current, and power
+        impelling forces on a vessel come from
+        wind, current, power and sails
+        If the sails are up the wind drives the vessel along its heading at
+        the speed from its polar, scaled by how much sail is set.
+        If no sails, then wind exerts a fraction of its power
+        on the floating object based on the vessel's windage.
         '''
-        # Could get wind and current here
-        (wind, current) = get_weather(self.db.position)
-        power = self.db.power
-        sails = self.db.sails
-        # polar = self.db.polar  # set by spawner?
-        heading = float(self.db.heading)
-        bearing = (heading, power)
-        print "wind: %s" % str(wind)
-        print "current: %s" % str(current)
-        # then calculate actual course here.
+        heading = float(self.heading)
+        power = float(self.power)
+        sails = float(self.sails)
+        windage = self.db.windage or 0.1
         if sails:
-            self.msg_contents("You're sailing")
-            wind = (heading, wind[1]/2)
-            # this lets us sail at any wind angle at half windspeed
-        else:
-            '''
-            if no sails, then wind exerts a fraction of its power
-            on the floating object based on the vessel's windage
-            '''
-            wind = (wind[0], wind[1] * self.db.windage)
-            # reduces wind effect to a fraction
-        course = add_vector(wind, current)
-        if power:
-            print "power: %s" % str(power)
-            print "bearing: %s" % str(bearing)
-            course = add_vector(course, bearing)
-            print "course: %s" % str(course)
-        position = move_vector(self.db.position, course)
-        self.arrive_at(position)
+            self.report("You're sailing")
+        return (heading, power, sails, windage, self.db.polar)
 
     def sail(self, wind, heading):
-        # TODO: seriously consider moving this to a sailing module.
         '''
         take wind (direction & speed) and boats heading.
-        then calculate true wind angle TWA
-        then look TWA and wind speed WS up in the polare
-        interpolate if necessary
-        return the boat speed and course over water.
+        return the boat speed and course over water from the polar,
+        see world/sailing.py. Unknown polars make no way.
         '''
-        print "sailing attempted"
-
-        # calculate TWA
-        wind_direction = wind[0]
-        twa = math.copysign(wind_direction - heading, 1)
-        if twa > 180:
-            twa = 2 * 180 - twa
-
-        # lookup polar
-        polar = self.db.polar
-        print "polar name = %s" % polar
-        # get find the bounding box of 1 to 4 windspeed and twa values
-
-        # interpolate
-
-        # return a boat speed and heading (should be same heading)
+        speed = sailing.sail_speed(self.db.polar, heading, wind,
+                                   float(self.sails))
+        return (heading, speed)
 
 # last line
@@ -0,0 +1,166 @@
+# The Atlas
+"""
+An in-memory spatial index of every room that has global coordinates.
+
+Looking a room up by its coordinates used to mean a search of the attribute
+table (search_object_attribute) every time a vessel moved.  The atlas keeps a
+dictionary keyed on quantized lat/lon so that "which room is at this fix"
+is a single dict lookup.
+
+The index is rebuilt from the database at server start (see
+server/conf/at_server_startstop.py) and is kept up to date by:
+
+    set_coordinates(room, position)  - use instead of room.db.coordinates = x
+    forget(room)                     - called by Room.at_object_delete
+
+Dynamic sea rooms move with their vessel every tick, so their coordinates
+can be written behind (see world/writeback.py). Read a room's coordinates
+with coordinates(room) to get the live value. A lone vessel only brings its
+sea room up to date when it takes a fix, and a dynamic sea room may be
+filed under a fix the vessel has long left. room_at() leaves them out;
+vessels meeting at sea are left to world/navigation.py.
+
+Positions are quantized to PRECISION decimal places, which is the resolution
+world.globe.move_vector rounds to.
+
+version() counts changes to the chart, rooms other than dynamic sea rooms
+being filed or dropped, so the navigation schedule knows when its
+predictions of landfall may be out of date.
+"""
+
+from evennia.utils import search, inherits_from
+from world import metrics, writeback
+
+PRECISION = 2  # decimal places, matches move_vector's rounding
+_SCALE = 10 ** PRECISION
+
+_INDEX = {}  # quantized key -> list of rooms at that fix
+_KEYS = {}  # room id -> quantized key it is filed under
+_VERSION = 0  # goes up when the chart changes, see version()
+
+
+def quantize(position):
+    '''
+    Turn a (lat, lon) fix into the integer key used by the index.
+    Returns None for a missing or malformed position.
+    '''
+    try:
+        lat, lon = position[0], position[1]
+        return (int(round(float(lat) * _SCALE)),
+                int(round(float(lon) * _SCALE)))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def rooms_at(position):
+    '''
+    Return a list of all rooms filed at position. Empty list if none.
+    '''
+    return list(_INDEX.get(quantize(position), ()))
+
+
+def room_at(position):
+    '''
+    Return the fixed room at position or None; dynamic sea rooms are left
+    out, see the module doc. There should only ever be one room per
+    coordinates, but if there are several then a DryLandRoom wins since it
+    must block movement.
+    '''
+    metrics.count("atlas.room_at")
+    rooms = [room for room in _INDEX.get(quantize(position), ())
+             if not inherits_from(room, "typeclasses.rooms.DynamicRoom")]
+    if not rooms:
+        return None
+    for room in rooms:
+        if inherits_from(room, "typeclasses.rooms.DryLandRoom"):
+            return room
+    return rooms[0]
+
+
+def rooms():
+    '''
+    Every room in the index.
+    '''
+    return [room for filed in _INDEX.values() for room in filed]
+
+
+def file_room(room):
+    '''
+    (Re)file a room in the index under its current coordinates.
+    '''
+    _unfile(room)
+    key = quantize(coordinates(room))
+    if key is None:
+        return
+    _INDEX.setdefault(key, []).append(room)
+    _KEYS[room.id] = key
+    _charted(room)
+
+
+def version():
+    '''
+    A number that changes whenever a room other than a dynamic sea room is
+    filed or dropped.
+    '''
+    return _VERSION
+
+
+def coordinates(room):
+    '''
+    The live coordinates of a room, including any not yet written behind.
+    '''
+    return writeback.live(room, "coordinates")
+
+
+def set_coordinates(room, position, defer=False):
+    '''
+    Set the coordinates of a room and keep the index in step.
+    All code that moves a room on the globe should go through here.
+    With defer the database write is left to the write-behind flush.
+    '''
+    if defer:
+        writeback.stage(room, "coordinates", position)
+    else:
+        writeback.store(room, "coordinates", position)
+    file_room(room)
+
+
+def forget(room):
+    '''
+    Drop a room from the index, e.g. when it is deleted.
+    '''
+    _unfile(room)
+
+
+def _charted(room):
+    global _VERSION
+    if not inherits_from(room, "typeclasses.rooms.DynamicRoom"):
+        _VERSION += 1
+
+
+def _unfile(room):
+    key = _KEYS.pop(room.id, None)
+    if key is None:
+        return
+    _charted(room)
+    rooms = _INDEX.get(key)
+    if not rooms:
+        return
+    rooms[:] = [other for other in rooms if other.id != room.id]
+    if not rooms:
+        del _INDEX[key]
+
+
+def rebuild():
+    '''
+    Throw the index away and build it again from the database. This is the
+    only place the atlas scans the attribute table.
+    '''
+    _INDEX.clear()
+    _KEYS.clear()
+    for room in search.search_object_attribute(key="coordinates"):
+        if room.location is None:  # only rooms, not objects that carry it
+            file_room(room)
+    return len(_KEYS)
+
+# last line
@@ -0,0 +1,182 @@
+# Autopilot
+"""
+Steering vessels along a list of waypoints.
+
+A vessel on autopilot keeps its waypoints in db.waypoints, a list of
+(lat, lon) fixes, and the one it is making for in db.destination, so the
+navigation schedule tells it when it gets there (see world/navigation.py);
+then it makes for the next one, and heaves to at the last.
+
+Each leg is sailed as a great circle. A vessel dead reckons along a rhumb
+line (see FloatingObject.set_course), so every UPDATE hours the fleet tick
+(see world/fleet.py) asks tick() which vessels should steer again: the
+great circle bearing to the waypoint is worked out for every engaged vessel
+at once, and the heading is corrected for how far the course over ground
+is off that bearing, leeway and current included. Only vessels off by more
+than TOLERANCE get a new heading, and the fleet works out their courses
+together, so hundreds of vessels on long passages cost one batch every
+UPDATE hours and a few events each.
+
+Engaged vessels are kept in memory and found again at server start by
+their db.autopilot flag (see server/conf/at_server_startstop.py).
+"""
+
+from evennia.utils import search
+from world import clock, metrics, navigation, writeback
+from world.globe import measure_vectors
+
+UPDATE = 1.0  # simulation hours between corrections of heading
+TOLERANCE = 1.0  # degrees off the bearing that need a new heading
+
+_ENGAGED = {}  # vessel id -> vessel on autopilot
+_STATE = {"hour": None}  # hour of the last corrections
+
+
+def rebuild():
+    '''
+    Rebuild the list of vessels on autopilot from the database.
+    '''
+    _ENGAGED.clear()
+    _STATE["hour"] = None
+    for vessel in search.search_object_attribute(key="autopilot",
+                                                 value=True):
+        if vessel.db.waypoints:
+            _ENGAGED[vessel.id] = vessel
+    return len(_ENGAGED)
+
+
+def engage(vessel, waypoints):
+    '''
+    Make for each of the (lat, lon) waypoints in turn, from the first.
+    Returns False, and does nothing, if vessel has no position.
+    '''
+    if not vessel.fix:
+        return False
+    waypoints = [(float(lat), float(lon)) for lat, lon in waypoints]
+    if not waypoints:
+        disengage(vessel)
+        return False
+    vessel.db.autopilot = True
+    vessel.db.waypoints = waypoints
+    vessel.db.destination = waypoints[0]
+    vessel.db.tolerance = None  # waypoints are steered for, not run down
+    _ENGAGED[vessel.id] = vessel
+    bearing = _bearings([vessel])[0][0]
+    vessel.heading = float(bearing)  # the fleet sets the course
+    if vessel.db.adrift:
+        navigation.expect(vessel)
+    return True
+
+
+def disengage(vessel):
+    '''
+    Take vessel off autopilot; it holds its heading.
+    '''
+    if vessel.db.autopilot:
+        vessel.db.autopilot = False
+        vessel.db.waypoints = None
+        vessel.db.destination = None
+    _ENGAGED.pop(vessel.id, None)
+
+
+def forget(vessel):
+    '''
+    Drop vessel from the engaged list, e.g. when it is deleted.
+    '''
+    _ENGAGED.pop(vessel.id, None)
+
+
+def engaged(vessel):
+    '''
+    True if vessel is on autopilot.
+    '''
+    return vessel.id in _ENGAGED
+
+
+def arrived(vessel):
+    '''
+    Called when vessel gets to its destination. Makes for the next
+    waypoint and returns True, or disengages at the last and returns False.
+    '''
+    if not engaged(vessel):
+        return False
+    waypoints = vessel.db.waypoints[1:]
+    if not waypoints:
+        disengage(vessel)
+        return False
+    vessel.db.waypoints = waypoints
+    vessel.db.destination = waypoints[0]
+    vessel.report("The %s makes for the next waypoint, %d to go.",
+                  vessel.key, len(waypoints))
+    bearing = _bearings([vessel])[0][0]
+    vessel.heading = float(bearing)
+    navigation.expect(vessel)
+    return True
+
+
+def eta(vessel, hour=None):
+    '''
+    Hours until vessel gets to its last waypoint at its present speed over
+    ground, or None if it is not on autopilot or making no way.
+    '''
+    if not engaged(vessel) or not vessel.segment or not vessel.fix:
+        return None
+    speed = vessel.segment[2]
+    if speed <= 0:
+        return None
+    waypoints = vessel.db.waypoints
+    distance = _bearings([vessel], hour)[1][0]
+    if len(waypoints) > 1:
+        lats, lons = zip(*waypoints)
+        distance += measure_vectors(lats[:-1], lons[:-1], lats[1:],
+                                    lons[1:])[1].sum()
+    return float(distance / speed)
+
+
+@metrics.timed("autopilot.tick")
+def tick(hour):
+    '''
+    Called by the fleet tick. Every UPDATE hours correct the headings of
+    vessels adrift on autopilot, and return those that need a new course.
+    '''
+    if not _ENGAGED or (_STATE["hour"] is not None and
+                        hour - _STATE["hour"] < UPDATE):
+        return []
+    _STATE["hour"] = hour
+    vessels = [vessel for vessel in _ENGAGED.values()
+               if vessel.db.adrift and vessel.fix and vessel.segment]
+    if not vessels:
+        return []
+    bearings, distances = _bearings(vessels, hour)
+    steered = []
+    for vessel, bearing, distance in zip(vessels, bearings.tolist(),
+                                         distances.tolist()):
+        if distance <= navigation.ARRIVAL:
+            navigation.expect(vessel)  # the schedule sees it arrive
+            continue
+        start, course, speed = vessel.segment
+        heading = float(vessel.heading)
+        off = (bearing - (course if speed else heading) + 180.0) % 360.0 \
+            - 180.0
+        if abs(off) > TOLERANCE:
+            # staged so the fleet plans every change together
+            writeback.stage(vessel, "heading", (heading + off) % 360.0)
+            steered.append(vessel)
+    metrics.count("autopilot.steered", len(steered))
+    return steered
+
+
+def _bearings(vessels, hour=None):
+    '''
+    Great circle bearings and distances from vessels to their
+    destinations, as arrays.
+    '''
+    if hour is None:
+        hour = clock.now()
+    lats, lons = navigation.reckon(vessels, hour, decimals=None)
+    destinations = [vessel.db.destination for vessel in vessels]
+    return measure_vectors(lats, lons,
+                           [fix[0] for fix in destinations],
+                           [fix[1] for fix in destinations])
+
+# last line
@@ -0,0 +1,92 @@
+# Bulletins
+"""
+Status messages for everyone aboard a vessel, coalesced.
+
+Moving a vessel used to send one msg_contents after another to everyone
+aboard: "Moving to", "already exists", "Creating new room", the look at
+the new room, "You're sailing" every time the course was worked out. Each
+of those is a network write per session, and the strings were formatted
+whether anyone was aboard or not.
+
+Status lines now go through post(), see FloatingObject.report:
+
+    - nothing is formatted or sent for a vessel without a player aboard
+    - lines posted while the server handles one event (a fleet tick, a
+      navigation event, a command) are sent together, as one message to
+      each recipient, right after
+    - the same line is sent at most once every REPEAT seconds per vessel,
+      so status that does not change is not repeated
+
+Messages that answer a command, and anything said aboard, still go out
+straight away with msg_contents.
+"""
+
+from django.conf import settings
+from twisted.internet import reactor
+from world import metrics
+
+REPEAT = getattr(settings, "MESSAGE_REPEAT", 30)  # seconds
+
+_BUFFER = {}  # vessel id -> (vessel, [(text, args)]) waiting to be sent
+_SENT = {}  # vessel id -> {(text, args): when it was last sent}
+_TIMER = {"call": None}
+
+
+def listening(vessel):
+    '''
+    True if there is a player aboard vessel to hear it.
+    '''
+    return any(obj.has_player for obj in vessel.contents)
+
+
+def post(vessel, text, *args):
+    '''
+    Queue a line, text % args, for everyone aboard vessel. Returns False if
+    nobody is there to hear it or the line went out just now.
+    '''
+    if not listening(vessel):
+        return False
+    now = reactor.seconds()
+    line = (text, args)
+    sent = _SENT.setdefault(vessel.id, {})
+    if now - sent.get(line, now - REPEAT) < REPEAT:
+        metrics.count("bulletin.repeated")
+        return False
+    sent[line] = now
+    metrics.count("bulletin.posted")
+    _BUFFER.setdefault(vessel.id, (vessel, []))[1].append(line)
+    if _TIMER["call"] is None:
+        _TIMER["call"] = reactor.callLater(0, flush)
+    return True
+
+
+@metrics.timed("bulletin.flush")
+def flush():
+    '''
+    Send everything queued, one message per vessel. Returns the number of
+    messages sent.
+    '''
+    _TIMER["call"] = None
+    now = reactor.seconds()
+    buffered = _BUFFER.values()
+    _BUFFER.clear()
+    metrics.count("bulletin.sent", len(buffered))
+    for vessel, lines in buffered:
+        sent = _SENT.get(vessel.id, {})
+        for line, when in sent.items():  # forget what may be sent again
+            if now - when >= REPEAT:
+                del sent[line]
+        if vessel.pk:
+            vessel.msg_contents("\n".join(text % args if args else text
+                                          for text, args in lines))
+    return len(buffered)
+
+
+def forget(vessel):
+    '''
+    Drop what is queued for vessel, e.g. when it is deleted.
+    '''
+    _BUFFER.pop(vessel.id, None)
+    _SENT.pop(vessel.id, None)
+
+# last line
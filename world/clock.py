@@ -0,0 +1,33 @@
+# The Clock
+"""
+Simulation time for the world at sea.
+
+One fleet tick is one hour at sea: a vessel making 5 knots moves 5 nautical
+miles every TICK seconds. Everything that schedules or interpolates over
+time (the fleet, the weather timeline) counts in these simulated hours.
+
+Simulation time is the server's runtime, so it stands still while the
+server is down: a vessel dead reckoning along a course (see
+typeclasses/vessel.py) picks up where it was after a restart instead of
+jumping ahead by the downtime.
+"""
+
+from evennia.utils import gametime
+
+TICK = 3  # real seconds per simulated hour
+
+
+def now():
+    '''
+    The current simulation time in hours.
+    '''
+    return gametime.runtime() / float(TICK)
+
+
+def seconds(hours):
+    '''
+    Real seconds it takes for hours of simulation time to pass.
+    '''
+    return hours * TICK
+
+# last line
@@ -0,0 +1,218 @@
+# Fields
+"""
+Wind and current fields and the weather timeline.
+
+A VectorField holds u (east) and v (north) components in knots on a regular
+lat/lon grid and interpolates them bilinearly at any fix. A WeatherTimeline
+is a list of wind/current keyframes interpolated over simulation hours.
+
+Directions follow the rest of the globe module, the direction a vector
+points towards in compass degrees.
+
+This module only needs NumPy, so tools can use it outside the server.
+"""
+
+from bisect import bisect_right
+import numpy as np
+
+
+class Field(object):
+    """
+    Anything that can sample u and v at arrays of fixes.
+    """
+    def sample(self, lats, lons):
+        '''
+        (u, v) arrays in knots at arrays of lats and lons, which broadcast
+        against each other. Every field has to implement it.
+        '''
+        raise NotImplementedError
+
+    def vectors(self, lats, lons):
+        '''
+        (directions, speeds) arrays at arrays of lats and lons.
+        '''
+        u, v = self.sample(lats, lons)
+        return to_polar(u, v)
+
+    def vector(self, position):
+        '''
+        (direction, speed) at a single (lat, lon) fix.
+        '''
+        directions, speeds = self.vectors(position[0], position[1])
+        return (float(directions), float(speeds))
+
+
+class VectorField(Field):
+    """
+    A wind or current field on a regular lat/lon grid.
+
+    u and v are float arrays shaped (latitudes, longitudes) starting at
+    lat0, lon0 and spaced step degrees apart; float32 for real grids to keep
+    them compact. They may be views into a memory map, they are never
+    copied. Longitude wraps around when the grid spans the globe, otherwise
+    fixes off the grid get the value at its edge.
+    """
+    def __init__(self, u, v, lat0=-90.0, lon0=-180.0, step=1.0):
+        self.u = _floats(u)
+        self.v = _floats(v)
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.step = float(step)
+        self.wrap = self.u.shape[1] * self.step >= 360.0
+
+    @classmethod
+    def uniform(cls, direction, speed):
+        '''
+        A field that is the same everywhere: one cell.
+        '''
+        u, v = to_components(direction, speed)
+        return cls([[u]], [[v]])
+
+    @classmethod
+    def grid(cls, step=1.0):
+        '''
+        An empty (calm) global field with cells step degrees apart.
+        '''
+        shape = (int(round(180 / step)) + 1, int(round(360 / step)))
+        return cls(np.zeros(shape, dtype=np.float32),
+                   np.zeros(shape, dtype=np.float32), step=step)
+
+    def sample(self, lats, lons):
+        '''
+        Bilinear interpolation of u and v at arrays of lats and lons.
+        '''
+        nlat, nlon = self.u.shape
+        y = (np.asarray(lats, dtype=float) - self.lat0) / self.step
+        x = (np.asarray(lons, dtype=float) - self.lon0) / self.step
+        y = np.clip(y, 0, nlat - 1)
+        i0 = np.floor(y).astype(int)
+        i1 = np.minimum(i0 + 1, nlat - 1)
+        if self.wrap:
+            x = np.mod(x, nlon)
+            j0 = np.floor(x).astype(int) % nlon
+            j1 = (j0 + 1) % nlon
+        else:
+            x = np.clip(x, 0, nlon - 1)
+            j0 = np.floor(x).astype(int)
+            j1 = np.minimum(j0 + 1, nlon - 1)
+        fy = y - i0
+        fx = x - np.floor(x)
+        w00 = (1 - fy) * (1 - fx)
+        w01 = (1 - fy) * fx
+        w10 = fy * (1 - fx)
+        w11 = fy * fx
+        u = (self.u[i0, j0] * w00 + self.u[i0, j1] * w01 +
+             self.u[i1, j0] * w10 + self.u[i1, j1] * w11)
+        v = (self.v[i0, j0] * w00 + self.v[i0, j1] * w01 +
+             self.v[i1, j0] * w10 + self.v[i1, j1] * w11)
+        return u, v
+
+    def pack(self):
+        '''
+        A compact dict of the field suitable for an Attribute.
+        '''
+        return {"lat0": self.lat0, "lon0": self.lon0, "step": self.step,
+                "shape": self.u.shape,
+                "u": self.u.astype(np.float32).tostring(),
+                "v": self.v.astype(np.float32).tostring()}
+
+    @classmethod
+    def unpack(cls, data):
+        '''
+        Rebuild a field from the output of pack().
+        '''
+        shape = tuple(data["shape"])
+        u = np.fromstring(data["u"], dtype=np.float32).reshape(shape)
+        v = np.fromstring(data["v"], dtype=np.float32).reshape(shape)
+        return cls(u, v, data["lat0"], data["lon0"], data["step"])
+
+
+class BlendedField(Field):
+    """
+    A field part way between two others, worked out only at the fixes that
+    are sampled. Used where blending whole grids up front would touch far
+    more of them than the fleet ever sails through.
+    """
+    def __init__(self, field_a, field_b, fraction):
+        self.field_a = field_a
+        self.field_b = field_b
+        self.fraction = fraction
+
+    def sample(self, lats, lons):
+        u_a, v_a = self.field_a.sample(lats, lons)
+        u_b, v_b = self.field_b.sample(lats, lons)
+        return (u_a + (u_b - u_a) * self.fraction,
+                v_a + (v_b - v_a) * self.fraction)
+
+
+class WeatherTimeline(object):
+    """
+    Keyframes of wind and current fields at simulation hours.
+    Between keyframes the fields are interpolated linearly, before the first
+    and after the last keyframe the weather holds.
+    """
+    def __init__(self, keyframes):
+        keyframes = sorted(keyframes, key=lambda keyframe: keyframe[0])
+        self.hours = [keyframe[0] for keyframe in keyframes]
+        self.winds = [keyframe[1] for keyframe in keyframes]
+        self.currents = [keyframe[2] for keyframe in keyframes]
+
+    def frame(self, hour):
+        '''
+        The (wind, current) fields at hour.
+        '''
+        index = bisect_right(self.hours, hour)
+        if index == 0:
+            return self.winds[0], self.currents[0]
+        if index == len(self.hours):
+            return self.winds[-1], self.currents[-1]
+        before, after = self.hours[index - 1], self.hours[index]
+        fraction = (hour - before) / float(after - before)
+        return (blend(self.winds[index - 1], self.winds[index], fraction),
+                blend(self.currents[index - 1], self.currents[index],
+                      fraction))
+
+
+def blend(field_a, field_b, fraction):
+    '''
+    Linear interpolation from field_a to field_b. The fields must share a
+    grid, except that a one-cell (uniform) field blends with any grid.
+    '''
+    if fraction <= 0:
+        return field_a
+    if fraction >= 1:
+        return field_b
+    grid = field_a if field_a.u.size >= field_b.u.size else field_b
+    if field_a.u.size > 1 and field_b.u.size > 1 and (
+            field_a.u.shape != field_b.u.shape or
+            field_a.step != field_b.step):
+        raise ValueError("Cannot blend weather fields on different grids.")
+    u = field_a.u + (field_b.u - field_a.u) * fraction
+    v = field_a.v + (field_b.v - field_a.v) * fraction
+    return VectorField(u.astype(grid.u.dtype), v.astype(grid.v.dtype),
+                       grid.lat0, grid.lon0, grid.step)
+
+
+def to_components(directions, speeds):
+    '''
+    Polar (direction, speed) to u (east) and v (north) components.
+    '''
+    radians = np.radians(directions)
+    return np.sin(radians) * speeds, np.cos(radians) * speeds
+
+
+def to_polar(u, v):
+    '''
+    u (east) and v (north) components to (direction, speed).
+    '''
+    return np.degrees(np.arctan2(u, v)) % 360.0, np.hypot(u, v)
+
+
+def _floats(values):
+    # keep float32 grids as they are, anything else becomes float
+    values = np.asarray(values)
+    if values.dtype.kind != "f":
+        values = values.astype(float)
+    return values
+
+# last line
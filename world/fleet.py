@@ -0,0 +1,282 @@
+# The Fleet
+"""
+One simulation tick for every floating object in the world.
+
+Floating objects used to register their own TickerHandler callback when
+cast off, so every floater did its own weather lookup, vector math and move
+every 3 seconds.  Instead, cast_off puts the floater on the fleet list and
+the fleet looks after all of them together.
+
+Floaters dead reckon. Each one holds a course and speed from its last fix
+(see FloatingObject.set_course) and its position at any time is worked out
+from those, so nothing needs to move it tick by tick. A course is only
+worked out again, in stages, when something could change it:
+
+    1. gather    - positions and steerage of the floaters concerned
+    2. weather   - wind and current for all of those positions
+    3. forces    - weather and each floater's steerage become force vectors
+    4. course    - sum the forces into a course and speed over ground
+
+Each stage works on arrays for all of those floaters at once. That happens when
+the weather changes (weather.version()), when a floater's steerage changes
+(FloatingObject.at_steerage_change) and when a floater is cast off. The
+fleet tick only checks for new weather, or a changed chart
+(atlas.version()); what happens to floaters along their courses, landfall,
+meetings and arrivals, is left to the navigation schedule (see
+world/navigation.py).
+
+Most floaters are flotsam nobody is watching. Only observed floaters, with
+a player aboard or in their room, or within SIGHT_RANGE of one that has,
+get a new course on every change of weather. The rest are brought up to
+date together every COARSE hours, and are only checked for meetings with
+observed floaters. Positions are dead reckoned either way, so a floater
+that gets an observer between two weather changes is exactly where it
+should be; attend() gives it a fresh course as well.
+
+The fleet list lives in memory and is rebuilt from the database at server
+start (see server/conf/at_server_startstop.py).
+"""
+
+import numpy as np
+from django.conf import settings
+from evennia import TICKER_HANDLER as tickerhandler
+from evennia.utils import search
+from world.globe import add_vectors
+from world import atlas, clock, metrics, navigation, weather, polars
+from world import autopilot, sailing
+from world.clock import TICK  # seconds between fleet ticks
+
+SIGHT_RANGE = getattr(settings, "SIGHT_RANGE", 12.0)  # nautical miles
+COARSE = 24.0  # simulation hours between courses of unobserved floaters
+
+_FLOATERS = {}  # floater id -> floating object
+_STALE = {}  # floater id -> unobserved floater that missed a weather change
+# versions courses were set for, and the hour of the last coarse update
+_PLANNED = {"weather": None, "chart": None, "coarse": None}
+
+
+def launch(floater):
+    '''
+    Put a floater on the fleet list so the fleet sets its course.
+    '''
+    _FLOATERS[floater.id] = floater
+
+
+def recall(floater):
+    '''
+    Take a floater off the fleet list, e.g. when anchored.
+    '''
+    _FLOATERS.pop(floater.id, None)
+    _STALE.pop(floater.id, None)
+    navigation.forget(floater)
+
+
+def floaters():
+    '''
+    All floaters currently on the fleet list.
+    '''
+    return _FLOATERS.values()
+
+
+def start():
+    '''
+    Start the fleet tick. Not persistent since at_server_start always
+    rebuilds the fleet and starts it again.
+    '''
+    tickerhandler.add(TICK, tick, idstring="fleet", persistent=False)
+
+
+def rebuild():
+    '''
+    Rebuild the fleet list from every floater adrift in the database.
+    Also removes the per-floater tickers that cast_off used to create.
+    '''
+    _FLOATERS.clear()
+    _STALE.clear()
+    _PLANNED.update(weather=None, chart=None, coarse=None)
+    navigation.clear()
+    for floater in search.search_object_attribute(key="adrift", value=True):
+        if not hasattr(floater, "steerage"):
+            continue
+        tickerhandler.remove(TICK, floater.make_way, idstring="adrift")
+        launch(floater)
+    return len(_FLOATERS)
+
+
+@metrics.timed("fleet.tick")
+def tick():
+    '''
+    Called by the ticker every TICK seconds. When the weather has changed
+    work out new courses for observed floaters, and every COARSE hours for
+    the rest, and for vessels on autopilot that steer again (see
+    world/autopilot.py). When the chart has changed the whole fleet needs
+    new predictions.
+    '''
+    hour = clock.now()
+    weather_version, chart_version = weather.version(), atlas.version()
+    if weather_version != _PLANNED["weather"]:
+        _PLANNED["weather"] = weather_version
+        fleet = [floater for floater in _FLOATERS.values()
+                 if floater.db.adrift]
+        observed = observe(fleet, hour)
+        plan([floater for floater in fleet if floater.id in observed])
+        for floater in fleet:
+            if floater.id in observed:
+                _STALE.pop(floater.id, None)
+            else:
+                _STALE[floater.id] = floater
+    if _STALE and (_PLANNED["coarse"] is None or
+                   hour - _PLANNED["coarse"] >= COARSE):
+        _PLANNED["coarse"] = hour
+        stale = [floater for floater in _STALE.values()
+                 if floater.db.adrift]
+        _STALE.clear()
+        plan(stale)
+    steered = autopilot.tick(hour)
+    if steered:
+        plan(steered)
+    if chart_version != _PLANNED["chart"]:
+        _PLANNED["chart"] = chart_version
+        for floater in _FLOATERS.values():
+            if floater.db.adrift:
+                navigation.expect(floater)
+
+
+def crewed(floater):
+    '''
+    True if a player is aboard floater or in the same room.
+    '''
+    if any(obj.has_player for obj in floater.contents):
+        return True
+    location = floater.location
+    return location is not None and any(obj.has_player
+                                        for obj in location.contents)
+
+
+def observe(fleet, hour=None):
+    '''
+    Work out which floaters of fleet someone can see: those with a player
+    aboard or in their room, and those within SIGHT_RANGE of them; only
+    floaters near the crewed ones are looked at (navigation.neighbours).
+    Marks each floater's ndb.observed and returns the set of observed ids.
+    '''
+    fleet = [floater for floater in fleet if floater.fix]
+    crews = [floater for floater in fleet if crewed(floater)]
+    observed = set(floater.id for floater in crews)
+    if crews and len(crews) < len(fleet):
+        if hour is None:
+            hour = clock.now()
+        ids = set(floater.id for floater in fleet)
+        for floater in crews:
+            position = floater.position_at(hour, decimals=None)
+            observed.update(other.id for other in
+                            navigation.neighbours(position, SIGHT_RANGE, hour)
+                            if other.id in ids)
+    for floater in fleet:
+        floater.ndb.observed = floater.id in observed
+    return observed
+
+
+def attend(floater):
+    '''
+    Someone can see floater now, e.g. a player came aboard: bring it up to
+    the present weather and check it for meetings with everyone.
+    '''
+    floater.ndb.observed = True
+    if _STALE.pop(floater.id, None) is not None:
+        plan([floater])
+    if floater.db.adrift:
+        navigation.expect(floater)
+
+
+def plan(fleet):
+    '''
+    Work out the course and speed over ground of every floater in fleet
+    from its steerage and the weather where it is now, and start it on that
+    course. Floaters already on that course keep it, and their place in the
+    navigation schedule.
+    '''
+    # gather
+    fleet = [floater for floater in fleet if floater.fix]
+    if not fleet:
+        return
+    metrics.count("fleet.planned", len(fleet))
+    hour = clock.now()
+    with metrics.timer("fleet.gather"):
+        lats, lons = navigation.reckon(fleet, hour, decimals=None)
+        positions = zip(lats.tolist(), lons.tolist())
+
+    # weather
+    with metrics.timer("fleet.weather"):
+        conditions = _weather(lats, lons)
+
+    # forces
+    with metrics.timer("fleet.forces"):
+        forces = _forces([floater.steerage() for floater in fleet],
+                         conditions)
+
+    # course
+    with metrics.timer("fleet.course"):
+        _course(fleet, positions, forces, hour)
+
+
+def _course(fleet, positions, forces, hour):
+    '''
+    Start each floater of fleet on the course its forces add up to. The
+    forces of the whole fleet are summed in one go.
+    '''
+    courses, speeds = add_vectors(*forces)
+    for floater, position, course, speed in zip(
+            fleet, positions, courses.tolist(), speeds.tolist()):
+        segment = floater.segment
+        if (segment and abs(segment[1] - course) < 1e-6 and
+                abs(segment[2] - speed) < 1e-6):
+            if not navigation.expecting(floater):
+                navigation.expect(floater)
+            continue
+        floater.set_course(course, speed, fix=position, hour=hour)
+
+
+def _weather(lats, lons):
+    '''
+    Wind and current at arrays of lats and lons, sampled from the weather
+    fields in one batch query each: arrays of wind directions, wind speeds,
+    current directions and current speeds.
+    '''
+    wind_dirs, wind_speeds = weather.winds(lats, lons)
+    current_dirs, current_speeds = weather.currents(lats, lons)
+    return wind_dirs, wind_speeds, current_dirs, current_speeds
+
+
+def _forces(steerage, conditions):
+    '''
+    The force vectors on each floater from its steerage and weather, as
+    arrays of directions and magnitudes shaped (floaters, 3): the sails,
+    or the wind on the hull, then the current, then power, which is zero
+    for a floater not under way. Sail speeds for the whole fleet come from
+    one polar lookup.
+    '''
+    headings, powers, sails, windages, names = zip(*steerage)
+    headings = np.array(headings, dtype=float)
+    wind_dirs, wind_speeds, current_dirs, current_speeds = conditions
+    rows = [polars.index(name) for name in names]
+    under_sail = [index for index, row in enumerate(rows)
+                  if row is not None and sails[index]]
+
+    directions = np.empty((len(steerage), 3))
+    magnitudes = np.empty((len(steerage), 3))
+    directions[:, 0] = wind_dirs
+    magnitudes[:, 0] = wind_speeds * np.array(windages, dtype=float)
+    if under_sail:
+        directions[under_sail, 0] = headings[under_sail]
+        magnitudes[under_sail, 0] = sailing.sail_speeds(
+            [rows[index] for index in under_sail], headings[under_sail],
+            wind_dirs[under_sail], wind_speeds[under_sail],
+            [sails[index] for index in under_sail])
+    directions[:, 1] = current_dirs
+    magnitudes[:, 1] = current_speeds
+    directions[:, 2] = headings  # bearing
+    magnitudes[:, 2] = powers
+    return directions, magnitudes
+
+# last line
@@ -6,53 +6,147 @@ Vessel command "North"  so that it can be used in other movement commands.
 """
 
 import math
+import numpy as np
 # from random import choice, randint
-from LatLon23 import LatLon  # ,Latitude, Longitude, string2latlon
-from evennia.utils import search  # ,inherits_from
+# from LatLon23 import LatLon  # ,Latitude, Longitude, string2latlon
+# from evennia.utils import search  # ,inherits_from
+from world import metrics, weather
 # from evennia.utils import create, search
 
+EARTH_RADIUS = 6371.0088 / 1.852  # mean earth radius in nautical miles
+
 
 def move_vector(fix, vector):
     """
     accepts a starting fix in lat lon
     determines destination after travelling a certain distance for
     a particular start heading
+
+    vector is (heading in degrees, distance in nautical miles)
     """
-    distance = vector[1] * 1.852  # convert NM to KM
-    heading = vector[0]  # is this radians or degrees?
-    # print "**********\ndebugging travel\n*********"
-    # print "Checking on the start_point"
-    # print start_point
-    # print type(start_point)
-    lat1 = fix[0]
-    lon1 = fix[1]
-    origin = LatLon(lat1, lon1)
-    destination_obj = origin.offset(heading, distance)
-    destination_tup = destination_obj.to_string()
-    lat2 = round(float(destination_tup[0]), 2)
-    lon2 = round(float(destination_tup[1]), 2)
-    return((lat2, lon2))
+    lat2, lon2 = move_vectors(fix[0], fix[1], vector[0], vector[1])
+    return (float(lat2), float(lon2))
+
+
+def move_vectors(lats, lons, headings, distances, decimals=2):
+    """
+    Batch form of move_vector. Takes arrays (or scalars) of start
+    latitudes, longitudes, initial headings in degrees and distances in
+    nautical miles and returns arrays of destination latitudes and
+    longitudes, rounded to decimals places (None for no rounding).
+
+    Uses the closed form spherical direct geodesic. Move_vector used to go
+    through LatLon23 which works on the WGS84 ellipsoid; the two agree to
+    within 0.6% of the distance travelled (about 0.3 nautical miles on a 60
+    mile step), anywhere between 80S and 80N.
+    """
+    lat1 = np.radians(np.asarray(lats, dtype=float))
+    lon1 = np.radians(np.asarray(lons, dtype=float))
+    theta = np.radians(np.asarray(headings, dtype=float))
+    delta = np.asarray(distances, dtype=float) / EARTH_RADIUS
+
+    sin_lat1, cos_lat1 = np.sin(lat1), np.cos(lat1)
+    sin_delta, cos_delta = np.sin(delta), np.cos(delta)
+    sin_lat2 = sin_lat1 * cos_delta + cos_lat1 * sin_delta * np.cos(theta)
+    lat2 = np.arcsin(np.clip(sin_lat2, -1.0, 1.0))
+    lon2 = lon1 + np.arctan2(np.sin(theta) * sin_delta * cos_lat1,
+                             cos_delta - sin_lat1 * sin_lat2)
+
+    lat2 = np.degrees(lat2)
+    lon2 = (np.degrees(lon2) + 540.0) % 360.0 - 180.0  # back to -180..180
+    if decimals is not None:
+        lat2 = np.round(lat2, decimals)
+        lon2 = np.round(lon2, decimals)
+    return lat2, lon2
+
+
+def rhumb_vectors(lats, lons, courses, distances, decimals=2):
+    """
+    Like move_vectors, but along rhumb lines: the track of a vessel that
+    holds one compass course the whole way, which is what dead reckoning
+    assumes. The result does not depend on how the distance is split up,
+    so a position can be worked out for any time along a course in one go.
+    Latitudes stop just short of the poles.
+    """
+    lat1 = np.radians(np.asarray(lats, dtype=float))
+    lon1 = np.radians(np.asarray(lons, dtype=float))
+    theta = np.radians(np.asarray(courses, dtype=float))
+    delta = np.asarray(distances, dtype=float) / EARTH_RADIUS
+
+    limit = math.radians(89.99)
+    lat2 = np.clip(lat1 + delta * np.cos(theta), -limit, limit)
+    dlat = lat2 - lat1
+    # stretched latitude difference; q is its ratio to the real one
+    dpsi = np.log(np.tan(np.pi / 4 + lat2 / 2) /
+                  np.tan(np.pi / 4 + lat1 / 2))
+    east_west = np.abs(dpsi) < 1e-12
+    q = np.where(east_west, np.cos(lat1),
+                 dlat / np.where(east_west, 1.0, dpsi))
+    lon2 = lon1 + delta * np.sin(theta) / q
+
+    lat2 = np.degrees(lat2)
+    lon2 = (np.degrees(lon2) + 540.0) % 360.0 - 180.0  # back to -180..180
+    if decimals is not None:
+        lat2 = np.round(lat2, decimals)
+        lon2 = np.round(lon2, decimals)
+    return lat2, lon2
 
 
 def get_weather(position):
     '''
     return the wind and current
     '''
-    matches = search.search_script("WorldWind")
-    print "\nmatches = %s, type = %s" % (matches, type(matches))
-    if not matches:
-        print "No match in the db for WorldWind.\n"
+    metrics.count("globe.get_weather")
+    if weather.world_wind() is None:
+        metrics.count("globe.no_weather")  # no WorldWind in the db
         return
-    WorldWind = matches[0]
-    string = "wind is %s\ncurrent is %s"
-    wind = WorldWind.return_wind((1, 1))
-    current = WorldWind.return_current((1, 1))
-    print string % (str(wind), str(current))
+    wind = weather.wind(position)
+    current = weather.current(position)
     return (wind, current)
 
 
 def measure(point_a, point_b):
-    pass
+    """
+    The great circle from fix point_a to fix point_b as a vector, (initial
+    bearing in degrees, distance in nautical miles): what move_vector
+    takes to get from one to the other.
+    """
+    bearing, distance = measure_vectors(point_a[0], point_a[1],
+                                        point_b[0], point_b[1])
+    return (float(bearing), float(distance))
+
+
+def measure_vectors(lats1, lons1, lats2, lons2, outer=False):
+    """
+    Batch form of measure. Takes arrays (or scalars) of latitudes and
+    longitudes of the fixes from and to, and returns arrays of initial
+    great circle bearings in degrees and distances in nautical miles.
+
+    The arrays broadcast against each other, so one fix and arrays of fixes
+    measure one to many, and equal arrays measure pair by pair. With outer
+    every fix from is measured to every fix to, in arrays shaped (from, to).
+
+    Distances use the haversine, which holds up for short ranges; sighting,
+    routing and the autopilot all measure with this one kernel.
+    """
+    lat1 = np.radians(np.asarray(lats1, dtype=float))
+    lon1 = np.radians(np.asarray(lons1, dtype=float))
+    lat2 = np.radians(np.asarray(lats2, dtype=float))
+    lon2 = np.radians(np.asarray(lons2, dtype=float))
+    if outer:
+        lat1, lon1 = lat1.reshape(-1, 1), lon1.reshape(-1, 1)
+        lat2, lon2 = lat2.reshape(1, -1), lon2.reshape(1, -1)
+
+    cos_lat1, cos_lat2 = np.cos(lat1), np.cos(lat2)
+    dlon = lon2 - lon1
+    haversine = (np.sin((lat2 - lat1) / 2) ** 2 +
+                 cos_lat1 * cos_lat2 * np.sin(dlon / 2) ** 2)
+    distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(haversine,
+                                                             0.0, 1.0)))
+    bearings = np.degrees(np.arctan2(
+        np.sin(dlon) * cos_lat2,
+        cos_lat1 * np.sin(lat2) - np.sin(lat1) * cos_lat2 * np.cos(dlon)))
+    return bearings % 360.0, distances
 
 
 def current_current(position):
@@ -76,26 +170,22 @@ def add_vector(v1, v2):
 
     v1 and v2 should be in the form (degree, nautical miles)
     '''
-    # Convert both angles to radians
-    # check input
-
-    print "v1 = %s" % str(v1)
-    print "v2 = %s" % str(v2)
-    dir1 = math.radians(v1[0])
-    dir2 = math.radians(v2[0])
-    mag1 = v1[1]
-    mag2 = v2[1]
-    # Test: simple reve. x and y once.
-    y = math.sin(dir1) * mag1 + math.sin(dir2) * mag2
-    x = math.cos(dir1) * mag1 + math.cos(dir2) * mag2
-    mag_result = math.hypot(x, y)
-    print "\nhypontenuse: %s" % mag_result
-    dir_rad = math.atan2(y, x)
-    # print "direction radians: %s\n" % dir_rad
-    # dir_deg = dir_rad * (180/math.pi)  # conversion
-    dir_deg = math.degrees(dir_rad)  # convert radians to degress
-    print "direction degrees: %s\n" % dir_deg
-    return (dir_deg, mag_result)
+    direction, magnitude = add_vectors([v1[0], v2[0]], [v1[1], v2[1]])
+    return (float(direction), float(magnitude))
+
+
+def add_vectors(directions, magnitudes):
+    '''
+    Batch form of add_vector. Takes arrays of directions in degrees and
+    magnitudes shaped (..., N), N vectors each for any number of floaters,
+    and returns arrays of the directions (0 to 360) and magnitudes of their
+    sums. A force a floater doesn't have is a zero magnitude.
+    '''
+    radians = np.radians(np.asarray(directions, dtype=float))
+    magnitudes = np.asarray(magnitudes, dtype=float)
+    u = (np.sin(radians) * magnitudes).sum(axis=-1)  # east
+    v = (np.cos(radians) * magnitudes).sum(axis=-1)  # north
+    return np.degrees(np.arctan2(u, v)) % 360.0, np.hypot(u, v)
 
 
 COMPASS_ROSE = [  # a list of directions and directions
@@ -0,0 +1,274 @@
+# The Land Mask
+"""
+A bit-packed land/sea raster for fast grounding checks along a path.
+
+The atlas only knows about land where a DryLandRoom is filed, one fix at a
+time. To tell whether a leg of any length runs over land, the land is also
+kept as a raster: one bit per cell, set for land. A leg is sampled every
+half cell and all samples are looked up in one go, which takes
+microseconds instead of a room lookup per fix.
+
+There are two layers:
+
+    rooms      - built from the DryLandRoom fixes in the atlas, on the atlas
+                 grid, and rebuilt whenever the chart changes
+                 (atlas.version()); CoastalRooms and sea rooms stay water
+    coastline  - imported from a raster file, see import_ascii_grid(), and
+                 memory-mapped; settings.LAND_MASK names the file to load
+
+A cell is land if either layer says so. Each layer covers a lat/lon box,
+everything outside it is water.
+
+Mask files are
+
+    header   struct HEADER, little endian:
+               magic "PLMK", version, rows, columns, lat0, lon0, step
+    bits     rows of ceil(columns / 8) bytes, most significant bit first,
+             row 0 at lat0 and column 0 at lon0
+
+and an ESRI ASCII grid (nonzero cells are land) converts to one with
+import_ascii_grid(), e.g. from @py:
+
+    @py from world import landmask; landmask.import_ascii_grid(
+        "coast.asc", "coast.lmask")
+"""
+
+import struct
+import numpy as np
+from django.conf import settings
+from world import atlas
+from world.globe import EARTH_RADIUS, move_vectors, rhumb_vectors
+
+MAGIC = "PLMK"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIddd")
+
+_LAYERS = {}  # "rooms" and "coastline" LandMasks
+_BUILT = {"chart": None}  # atlas version the rooms layer was built for
+
+
+class LandMask(object):
+    """
+    One layer of land: packed bits on a lat/lon grid of step degrees
+    starting at lat0, lon0. bits may be a view into a memory map.
+    """
+    def __init__(self, bits, columns, lat0, lon0, step):
+        self.bits = bits
+        self.rows = bits.shape[0]
+        self.columns = columns
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.step = float(step)
+
+    @classmethod
+    def from_cells(cls, lats, lons, step):
+        '''
+        A mask with land at the cells of arrays of lats and lons.
+        '''
+        rows = np.round(np.asarray(lats, dtype=float) / step).astype(int)
+        columns = np.round(np.asarray(lons, dtype=float) / step).astype(int)
+        if not rows.size:
+            return None
+        row0, column0 = rows.min(), columns.min()
+        grid = np.zeros((rows.max() - row0 + 1, columns.max() - column0 + 1),
+                        dtype=bool)
+        grid[rows - row0, columns - column0] = True
+        return cls.from_grid(grid, row0 * step, column0 * step, step)
+
+    @classmethod
+    def from_grid(cls, grid, lat0, lon0, step):
+        '''
+        A mask from a boolean array shaped (rows, columns).
+        '''
+        grid = np.asarray(grid, dtype=bool)
+        return cls(np.packbits(grid, axis=1), grid.shape[1], lat0, lon0, step)
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Map a mask file read-only.
+        '''
+        with open(path, "rb") as mask:
+            header = HEADER.unpack(mask.read(HEADER.size))
+        magic, version, rows, columns, lat0, lon0, step = header
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %s land mask."
+                             % (path, VERSION))
+        bits = np.memmap(path, dtype=np.uint8, mode="r", offset=HEADER.size,
+                         shape=(rows, (columns + 7) // 8))
+        return cls(bits, columns, lat0, lon0, step)
+
+    def save(self, path):
+        '''
+        Write the mask to a file, see the module doc.
+        '''
+        with open(path, "wb") as mask:
+            mask.write(HEADER.pack(MAGIC, VERSION, self.rows, self.columns,
+                                   self.lat0, self.lon0, self.step))
+            mask.write(np.asarray(self.bits, dtype=np.uint8).tostring())
+
+    def land(self, lats, lons):
+        '''
+        Boolean array, True where arrays of lats and lons are on land.
+        '''
+        rows = np.round((np.asarray(lats, dtype=float) - self.lat0) /
+                        self.step).astype(int)
+        columns = np.round((np.asarray(lons, dtype=float) - self.lon0) /
+                           self.step).astype(int)
+        # wrap whole turns only, after rounding: a fix just west of lon0 is
+        # still in column 0
+        columns %= int(round(360.0 / self.step))
+        inside = ((rows >= 0) & (rows < self.rows) &
+                  (columns >= 0) & (columns < self.columns))
+        rows = np.where(inside, rows, 0)
+        columns = np.where(inside, columns, 0)
+        bytes_ = self.bits[rows, columns >> 3]
+        return inside & ((bytes_ >> (7 - (columns & 7))) & 1).astype(bool)
+
+
+def land(lats, lons):
+    '''
+    Boolean array, True where arrays of lats and lons are on land in any
+    layer.
+    '''
+    result = np.zeros(np.broadcast(np.asarray(lats), np.asarray(lons)).shape,
+                      dtype=bool)
+    for mask in _layers():
+        result |= mask.land(lats, lons)
+    return result
+
+
+def is_land(position):
+    '''
+    True if the (lat, lon) fix is on land.
+    '''
+    return bool(land(position[0], position[1]))
+
+
+def first_land(fix, course, distance, great_circle=False):
+    '''
+    How far in nautical miles along a leg from fix, on course for distance,
+    the first land is; None if the leg is clear. The leg is a rhumb line,
+    or a great circle with great_circle.
+    '''
+    layers = _layers()
+    if not layers or distance <= 0:
+        return None
+    step = min(mask.step for mask in layers) * 60.0 / 2
+    step *= max(np.cos(np.radians(fix[0])), 0.1)  # narrower cells east-west
+    distances = np.append(np.arange(0.0, distance, step), distance)
+    move = move_vectors if great_circle else rhumb_vectors
+    lats, lons = move(fix[0], fix[1], course, distances, None)
+    hits = land(lats, lons).nonzero()[0]
+    if not hits.size:
+        return None
+    return float(distances[hits[0]])
+
+
+def crossings(lats, lons, courses, distances, samples=16):
+    '''
+    Batch form of first_land for many rhumb line legs at once: a boolean
+    array, True where the leg from lats, lons on courses for distances
+    touches land. Legs are sampled at up to samples points each, so land
+    narrower than a leg over samples can slip through on long legs.
+    '''
+    lats = np.asarray(lats, dtype=float)
+    layers = _layers()
+    if not layers or not lats.size:
+        return np.zeros(lats.shape, dtype=bool)
+    distances = np.asarray(distances, dtype=float)
+    step = min(mask.step for mask in layers) * 60.0 / 2
+    count = int(min(max(np.ceil(distances.max() / step), 1), samples))
+    fractions = np.arange(1, count + 1) / float(count)
+    # one row of samples per leg
+    lons = np.asarray(lons, dtype=float)[..., None]
+    courses = np.asarray(courses, dtype=float)[..., None]
+    lats, lons = rhumb_vectors(lats[..., None], lons, courses,
+                               distances[..., None] * fractions, None)
+    return land(lats, lons).any(axis=-1)
+
+
+def blocked(start, end):
+    '''
+    True if there is land between the (lat, lon) fixes start and end, or at
+    either of them.
+    '''
+    dlat = np.radians(end[0] - start[0])
+    dlon = np.radians((end[1] - start[1] + 540.0) % 360.0 - 180.0)
+    mean = np.radians((start[0] + end[0]) / 2.0)
+    x, y = dlon * np.cos(mean), dlat
+    distance = np.hypot(x, y) * EARTH_RADIUS
+    if distance == 0:
+        return is_land(start)
+    course = np.degrees(np.arctan2(x, y)) % 360.0
+    return first_land(start, course, distance) is not None or is_land(end)
+
+
+def load(path=None):
+    '''
+    Map the coastline layer from a mask file, by default settings.LAND_MASK.
+    Returns the mask, or None without one.
+    '''
+    if path is None:
+        path = getattr(settings, "LAND_MASK", None)
+        if not path:
+            return None
+    _LAYERS["coastline"] = LandMask.open(path)
+    return _LAYERS["coastline"]
+
+
+def rebuild():
+    '''
+    Build the rooms layer from the DryLandRoom fixes in the atlas.
+    Returns the number of land cells.
+    '''
+    fixes = [atlas.coordinates(room) for room in atlas.rooms()
+             if room.is_typeclass("rooms.DryLandRoom")]
+    fixes = [fix for fix in fixes if fix]
+    _BUILT["chart"] = atlas.version()
+    mask = LandMask.from_cells([fix[0] for fix in fixes],
+                               [fix[1] for fix in fixes],
+                               1.0 / 10 ** atlas.PRECISION)
+    if mask is None:
+        _LAYERS.pop("rooms", None)
+    else:
+        _LAYERS["rooms"] = mask
+    return len(fixes)
+
+
+def import_ascii_grid(grid_path, mask_path):
+    '''
+    Convert an ESRI ASCII grid, nonzero cells being land, to a mask file.
+    Returns the mask.
+    '''
+    header = {}
+    with open(grid_path) as grid:
+        for line in grid:
+            parts = line.split()
+            if not parts or not parts[0][0].isalpha():
+                break
+            header[parts[0].lower()] = float(parts[1])
+    rows, columns = int(header["nrows"]), int(header["ncols"])
+    step = header["cellsize"]
+    if "xllcenter" in header:
+        lon0, lat0 = header["xllcenter"], header["yllcenter"]
+    else:
+        lon0 = header["xllcorner"] + step / 2
+        lat0 = header["yllcorner"] + step / 2
+    values = np.loadtxt(grid_path, skiprows=len(header))
+    values = values.reshape(rows, columns)[::-1]  # south row first
+    nodata = header.get("nodata_value")
+    land_cells = values != 0
+    if nodata is not None:
+        land_cells &= values != nodata
+    mask = LandMask.from_grid(land_cells, lat0, lon0, step)
+    mask.save(mask_path)
+    return mask
+
+
+def _layers():
+    if _BUILT["chart"] != atlas.version():
+        rebuild()
+    return _LAYERS.values()
+
+# last line
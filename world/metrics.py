@@ -0,0 +1,172 @@
+# Metrics
+"""
+Counters and timers for the simulation, to see where tick time goes.
+
+The hot paths used to print to stdout to show what they were doing, which
+is slow, synchronous and impossible to read under load. Instead they count
+and time themselves here:
+
+    count("navigation.meeting")         - one more of something
+    with timer("fleet.weather"):        - time a stage
+        ...
+    @timed("sighting.sweep")            - time every call of a function
+
+Names are "module.stage". Metrics are off unless settings.METRICS is True
+or they are switched on with the @metrics command. While off, count() is a
+flag check and timer() hands back a shared do-nothing context, so the cost
+is next to nothing. While on, they aggregate: a count per counter, and
+calls, total and worst time per timer; nothing is written anywhere until
+someone asks, with report() or dump() to the server log.
+"""
+
+import functools
+from collections import defaultdict
+from timeit import default_timer
+from django.conf import settings
+from evennia.utils import logger
+
+_STATE = {"on": getattr(settings, "METRICS", False),
+          "since": default_timer()}
+_COUNTS = defaultdict(int)  # counter name -> count
+_TIMES = {}  # timer name -> [calls, total seconds, worst seconds]
+
+
+class _Timer(object):
+    """
+    Times one stage and adds it to the totals of name.
+    """
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = default_timer()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = default_timer() - self.start
+        totals = _TIMES.get(self.name)
+        if totals is None:
+            totals = _TIMES[self.name] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += elapsed
+        if elapsed > totals[2]:
+            totals[2] = elapsed
+        return False
+
+
+class _Off(object):
+    """
+    Stands in for a timer while metrics are off.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_OFF = _Off()
+
+
+def enabled():
+    '''
+    True if metrics are being collected.
+    '''
+    return _STATE["on"]
+
+
+def enable(on=True):
+    '''
+    Switch collecting on or off. Switching on starts from zero.
+    '''
+    if on and not _STATE["on"]:
+        reset()
+    _STATE["on"] = bool(on)
+
+
+def reset():
+    '''
+    Start all counters and timers from zero.
+    '''
+    _COUNTS.clear()
+    _TIMES.clear()
+    _STATE["since"] = default_timer()
+
+
+def count(name, number=1):
+    '''
+    Add number to the counter name.
+    '''
+    if _STATE["on"]:
+        _COUNTS[name] += number
+
+
+def timer(name):
+    '''
+    A context that times what runs in it as name.
+    '''
+    if _STATE["on"]:
+        return _Timer(name)
+    return _OFF
+
+
+def timed(name):
+    '''
+    Decorator that times every call of a function as name.
+    '''
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _STATE["on"]:
+                return function(*args, **kwargs)
+            with _Timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    '''
+    The counters and timers so far, as {name: count} and
+    {name: (calls, total seconds, worst seconds)}.
+    '''
+    return (dict(_COUNTS),
+            dict((name, tuple(totals)) for name, totals in _TIMES.items()))
+
+
+def report():
+    '''
+    The counters and timers so far as lines of text, the timers that took
+    longest first.
+    '''
+    if not _STATE["on"] and not _COUNTS and not _TIMES:
+        return ["Metrics are off."]
+    lines = ["Metrics over %.0f seconds, %s." %
+             (default_timer() - _STATE["since"],
+              "collecting" if _STATE["on"] else "stopped")]
+    if _TIMES:
+        lines.append("%-28s %8s %10s %9s %9s" %
+                     ("timer", "calls", "total ms", "mean ms", "worst ms"))
+    for name, (calls, total, worst) in sorted(
+            _TIMES.items(), key=lambda item: -item[1][1]):
+        lines.append("%-28s %8d %10.1f %9.3f %9.3f" %
+                     (name, calls, total * 1000, total * 1000 / calls,
+                      worst * 1000))
+    if _COUNTS:
+        lines.append("%-28s %8s" % ("counter", "count"))
+    for name, number in sorted(_COUNTS.items()):
+        lines.append("%-28s %8d" % (name, number))
+    return lines
+
+
+def dump():
+    '''
+    Write the report to the server log.
+    '''
+    logger.log_info("\n".join(report()))
+
+# last line
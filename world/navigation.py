@@ -0,0 +1,482 @@
+# Navigation
+"""
+Dead reckoning and the navigation schedule.
+
+Floaters dead reckon (see FloatingObject.set_course): between changes of
+course their position is a function of time, so nothing needs to look at
+them tick by tick. Instead, whenever a floater starts a new course the
+schedule works out when the next thing will happen to it:
+
+    room        - it reaches a cell of the atlas that has a fixed room in
+                  it, or land (see world/landmask.py), or leaves the cell of
+                  a fixed room, e.g. a harbour
+    meeting     - it comes within PROXIMITY of another floater
+    parting     - it gets more than PARTING from everyone in its sea room
+    bucket      - it moves into another bucket of the spatial hash
+    destination - it gets within ARRIVAL of its destination, or to its
+                  closest approach if that is within db.tolerance; the
+                  travel command allows OFFSET of the leg for current and
+                  leeway
+    horizon     - nothing happens within HORIZON hours; look again then
+
+Only the earliest event of each floater is queued. A single timer wakes
+the schedule when the first event in the queue is due, the event is
+handled and the floaters involved are looked at again. So the work done
+scales with the number of events, not with floaters times ticks.
+
+Floaters that meet at sea share a sea room, so their crews see each other:
+whoever has less company joins the other's DynamicRoom. PROXIMITY is
+settings.SHARE_RADIUS. A floater stays in a shared room until it is more
+than PARTING, twice that, from all the others there, and then gets a sea
+room of its own from the room pool (see world/roompool.py). The gap between
+the two keeps floaters on the edge from joining and parting over and over.
+
+Meetings are only looked for among floaters nearby. Every floater in the
+schedule is filed in a spatial hash (see world/spatial.py) with buckets
+SIGHT_RANGE across, and moves bucket by an event of its own, so who is
+near a fix is a look at a few buckets, whatever the size of the fleet;
+see neighbours().
+
+Predictions go stale when a floater changes course. Every prediction
+carries a token and a new course hands out a new token, so stale events
+are just dropped when they come up.
+"""
+
+import itertools
+from heapq import heappush, heappop
+import numpy as np
+from django.conf import settings
+from twisted.internet import reactor
+from evennia.utils import logger
+from world import atlas, clock, landmask, metrics
+from world.globe import rhumb_vectors
+from world.spatial import SpatialHash
+
+HORIZON = 24.0  # simulation hours to look ahead
+# nautical miles, close enough to hail and share a sea room
+PROXIMITY = getattr(settings, "SHARE_RADIUS", 1.0)
+PARTING = 2 * PROXIMITY  # nautical miles apart to leave a shared sea room
+ARRIVAL = 0.5  # nautical miles from a destination counts as there
+OFFSET = 0.2  # of a leg travelled, how far current and leeway may set off
+MAX_SAMPLES = 2000  # points along a track checked against the atlas
+CELL = 60.0 / 10 ** atlas.PRECISION  # nautical miles across an atlas cell
+
+_QUEUE = []  # heap of events, see _push
+_FLOATERS = {}  # floater id -> floater with a prediction
+_TOKENS = {}  # floater id -> token of its latest prediction
+_PENDING = {}  # floater id -> floater waiting for a prediction
+_HASH = SpatialHash(getattr(settings, "SIGHT_RANGE", 12.0))
+_TIMER = {"call": None, "busy": False}
+_SEQUENCE = itertools.count()
+
+
+def reckon(floaters, hour, decimals=2):
+    '''
+    Dead reckoning positions of floaters at hour, as arrays of latitudes
+    and longitudes.
+    '''
+    lats, lons, courses, distances = [], [], [], []
+    for floater in floaters:
+        fix = floater.fix
+        start, course, speed = floater.segment or (hour, 0.0, 0.0)
+        lats.append(fix[0])
+        lons.append(fix[1])
+        courses.append(course)
+        distances.append(speed * max(hour - start, 0.0))
+    return rhumb_vectors(lats, lons, courses, distances, decimals)
+
+
+def expect(floater):
+    '''
+    Work out the next event of floater, e.g. after a change of course.
+    Predictions are made together when the schedule next wakes, which is
+    straight away, so several changes at once cost one prediction.
+    '''
+    _PENDING[floater.id] = floater
+    for mate in roommates(floater):  # when they part depends on us
+        _PENDING[mate.id] = mate
+    _arm()
+
+
+def expecting(floater):
+    '''
+    True if floater has a prediction in the schedule or waiting for one.
+    '''
+    return floater.id in _TOKENS or floater.id in _PENDING
+
+
+def forget(floater):
+    '''
+    Drop floater from the schedule, e.g. when it is anchored.
+    '''
+    _FLOATERS.pop(floater.id, None)
+    _TOKENS.pop(floater.id, None)
+    _PENDING.pop(floater.id, None)
+    _HASH.remove(floater.id)
+
+
+def clear():
+    '''
+    Empty the schedule.
+    '''
+    del _QUEUE[:]
+    _HASH.clear()
+    _FLOATERS.clear()
+    _TOKENS.clear()
+    _PENDING.clear()
+    _arm()
+
+
+def pending():
+    '''
+    Number of events in the queue, stale ones included.
+    '''
+    return len(_QUEUE)
+
+
+@metrics.timed("navigation.wake")
+def wake():
+    '''
+    Handle every event that is due, make the waiting predictions and set
+    the timer for the next event. Called by the timer.
+    '''
+    _TIMER["call"] = None
+    _TIMER["busy"] = True
+    try:
+        hour = clock.now()
+        while _QUEUE and _QUEUE[0][0] <= hour:
+            event = heappop(_QUEUE)
+            try:
+                _handle(event)
+            except Exception:
+                logger.log_trace("Navigation event %s failed." % (event,))
+        floaters = _PENDING.values()
+        _PENDING.clear()
+        predict(floaters, clock.now())
+    finally:
+        _TIMER["busy"] = False
+    _arm()
+
+
+@metrics.timed("navigation.predict")
+def predict(floaters, hour):
+    '''
+    Queue the next event of each of floaters, as from hour.
+    '''
+    metrics.count("navigation.predicted", len(floaters))
+    for floater in floaters:  # tokens and buckets first, for meetings
+        _FLOATERS[floater.id] = floater
+        _TOKENS[floater.id] = next(_SEQUENCE)
+        if floater.fix and floater.db.adrift:
+            _HASH.file(floater.id, floater,
+                       floater.position_at(hour, decimals=None))
+        else:
+            _HASH.remove(floater.id)
+    for floater in floaters:
+        if not floater.fix or not floater.db.adrift:
+            continue
+        event = (hour + HORIZON, "horizon", None)
+        for found in (_room(floater, hour), _destination(floater, hour),
+                      _meeting(floater, hour), _parting(floater, hour)):
+            if found and found[0] < event[0]:
+                event = found
+        _push(event[0], event[1], floater, _TOKENS[floater.id], event[2])
+
+
+def neighbours(position, distance, hour=None):
+    '''
+    Floaters in the schedule within distance nautical miles of position at
+    hour, by default now. Only looks at the buckets around position.
+    '''
+    if hour is None:
+        hour = clock.now()
+    others = list(_HASH.near(position, distance))
+    if not others:
+        return []
+    lats, lons = reckon(others, hour, decimals=None)
+    close = ranges(position, lats, lons) <= distance
+    return [other for other, near in zip(others, close.tolist()) if near]
+
+
+def roommates(floater):
+    '''
+    The other floaters sharing a sea room with floater.
+    '''
+    location = floater.location
+    if not at_sea(location):
+        return []
+    return [obj for obj in location.contents
+            if obj.id != floater.id and hasattr(obj, "position_at")]
+
+
+def at_sea(room):
+    '''
+    True if room is a sea room floaters take along or share, not a fixed
+    room.
+    '''
+    return room is not None and room.is_typeclass("rooms.DynamicRoom")
+
+
+def _push(hour, kind, floater, token, other=None):
+    other_token = _TOKENS.get(other.id) if other else None
+    heappush(_QUEUE, (hour, next(_SEQUENCE), kind, floater, token,
+                      other, other_token))
+
+
+def _arm():
+    '''
+    Make sure the timer goes off when the first event is due.
+    '''
+    if _TIMER["busy"]:
+        return  # wake() arms it when it is done
+    if _PENDING:
+        delay = 0.0
+    elif _QUEUE:
+        delay = max(clock.seconds(_QUEUE[0][0] - clock.now()), 0.0)
+    else:
+        delay = None
+    call = _TIMER["call"]
+    if call is not None and call.active():
+        if delay is not None and call.getTime() <= reactor.seconds() + delay:
+            return
+        call.cancel()
+    _TIMER["call"] = None
+    if delay is not None:
+        _TIMER["call"] = reactor.callLater(delay, wake)
+
+
+def _handle(event):
+    hour, _, kind, floater, token, other, other_token = event
+    if _TOKENS.get(floater.id) != token or floater.id in _PENDING:
+        metrics.count("navigation.stale")
+        return  # stale, floater has been looked at since
+    metrics.count("navigation." + kind)
+    if other is not None and (_TOKENS.get(other.id) != other_token or
+                              other.id in _PENDING):
+        # the other floater changed course, the meeting may be off
+        _PENDING[floater.id] = floater
+        return
+    if kind == "room":
+        position = floater.position_at(hour)
+        room = atlas.room_at(position)
+        # landfall is predicted on the track itself, not the rounded fix
+        if (landmask.is_land(floater.position_at(hour, decimals=None)) or
+                landmask.is_land(position)):
+            floater.run_aground(hour)
+        elif room is not floater.location:
+            floater.arrive_at(position)
+    elif kind == "destination":
+        floater.take_fix()
+        floater.at_destination()
+    elif kind == "meeting":
+        floater.take_fix()
+        other.take_fix()
+        floater.at_meeting(other)
+        other.at_meeting(floater)
+        _share(floater, other)
+        _PENDING[other.id] = other
+    elif kind == "parting":
+        parting = _parting(floater, hour)
+        if parting and parting[0] <= hour + 1e-6:
+            for mate in roommates(floater):
+                _PENDING[mate.id] = mate
+            floater.part_company()
+    _PENDING[floater.id] = floater
+
+
+def _share(floater, other):
+    '''
+    Put two floaters that have met in one sea room: whoever has less
+    company joins the other. Fixed rooms are left alone.
+    '''
+    here, there = floater.location, other.location
+    if here is there or not at_sea(here) or not at_sea(there):
+        return
+    if len(here.contents) > len(there.contents):
+        floater, other = other, floater
+    for mate in roommates(floater):
+        _PENDING[mate.id] = mate
+    floater.join(other)
+
+
+def _room(floater, hour):
+    '''
+    When the track of floater next gets to a cell of the atlas that calls
+    for a move, or to another bucket of the hash, or None within HORIZON.
+    '''
+    start, course, speed = floater.segment or (hour, 0.0, 0.0)
+    if not speed:
+        return None
+    fix = floater.fix
+    location = floater.location
+    # floaters take sea rooms along, but leave fixed rooms behind
+    home = None
+    if location is not None and not at_sea(location):
+        home = atlas.quantize(atlas.coordinates(location))
+    # sample the track often enough not to step over a cell
+    step = CELL / 2 * max(np.cos(np.radians(fix[0])), 0.1)
+    interval = step / speed
+    samples = int(min(np.ceil(HORIZON / interval), MAX_SAMPLES))
+    hours = hour + interval * np.arange(1, samples + 1)
+    lats, lons = rhumb_vectors(fix[0], fix[1], course,
+                               speed * (hours - start), None)
+    # nothing gets past land, and a new bucket means a new prediction, so
+    # only look for rooms up to the first of those
+    ashore = landmask.land(lats, lons).nonzero()[0]
+    rows, columns = _HASH.keys(lats, lons)
+    row, column = _HASH.key(floater.position_at(hour, decimals=None))
+    moved = ((rows != row) | (columns != column)).nonzero()[0]
+    cut = min(ashore[:1].tolist() + moved[:1].tolist() + [samples - 1])
+    hours, lats, lons = hours[:cut + 1], lats[:cut + 1], lons[:cut + 1]
+    previous = None
+    for when, lat, lon in zip(hours.tolist(), lats.tolist(), lons.tolist()):
+        key = atlas.quantize((lat, lon))
+        if key == previous:
+            continue
+        previous = key
+        if home is not None and key != home:
+            return (when, "room", None)
+        if any(room is not location and not at_sea(room)
+               for room in atlas.rooms_at((lat, lon))):
+            return (when, "room", None)
+    if ashore.size and ashore[0] == cut:
+        return (float(hours[-1]), "room", None)
+    if moved.size and moved[0] == cut:
+        return (float(hours[-1]), "bucket", None)
+    return (float(hours[-1]), "horizon", None)
+
+
+def _destination(floater, hour):
+    '''
+    When floater gets closest to its destination, if that is close
+    enough (see the module doc), or None.
+    '''
+    destination = floater.db.destination
+    if not destination:
+        return None
+    start, course, speed = floater.segment or (hour, 0.0, 0.0)
+    position = floater.position_at(hour, decimals=None)
+    x, y = _offsets(position, [destination[0]], [destination[1]])
+    vx, vy = _velocity(course, speed)
+    if np.hypot(x[0], y[0]) <= ARRIVAL:
+        return (hour, "destination", None)
+    if not speed:
+        return None
+    t = (x[0] * vx + y[0] * vy) / (speed * speed)
+    miss = np.hypot(x[0] - vx * t, y[0] - vy * t)
+    if t < 0 or t > HORIZON or miss > max(ARRIVAL,
+                                          floater.db.tolerance or 0.0):
+        return None
+    return (hour + t, "destination", None)
+
+
+def _meeting(floater, hour):
+    '''
+    When floater next comes within PROXIMITY of another floater nearby in
+    the schedule, or None. Floaters in the same room already are skipped.
+    Floaters within PROXIMITY meet right away if they can share a sea room,
+    and are skipped if not. Meetings nobody can see (neither floater has
+    ndb.observed, see fleet.observe) are not looked for.
+    '''
+    observed = floater.ndb.observed
+    location = floater.location
+    position = floater.position_at(hour, decimals=None)
+    others = [other for other in _HASH.near(position, PROXIMITY)
+              if other.id != floater.id and other.fix and other.db.adrift and
+              other.location != location and
+              (observed or other.ndb.observed)]
+    if not others:
+        return None
+    start, course, speed = floater.segment or (hour, 0.0, 0.0)
+    lats, lons = reckon(others, hour, decimals=None)
+    x, y = _offsets(position, lats, lons)
+    segments = [other.segment or (hour, 0.0, 0.0) for other in others]
+    vx, vy = _velocity([segment[1] for segment in segments],
+                       [segment[2] for segment in segments])
+    own_vx, own_vy = _velocity(course, speed)
+    # relative motion: |p + w t| = PROXIMITY
+    wx, wy = vx - own_vx, vy - own_vy
+    a = wx * wx + wy * wy
+    b = 2 * (x * wx + y * wy)
+    c = x * x + y * y - PROXIMITY * PROXIMITY
+    disc = b * b - 4 * a * c
+    # c near 0 is a meeting just handled, not a new one
+    outside = c > 1e-6 * PROXIMITY * PROXIMITY
+    moving = (a > 1e-12) & (disc >= 0) & outside
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(moving, (-b - np.sqrt(np.where(moving, disc, 0))) /
+                     np.where(moving, 2 * a, 1), np.inf)
+    t[t < 0] = np.inf
+    if at_sea(location):
+        t[~outside & np.array([at_sea(other.location) for other in others],
+                              dtype=bool)] = 0.0
+    first = int(np.argmin(t))
+    if t[first] > HORIZON:
+        return None
+    return (hour + float(t[first]), "meeting", others[first])
+
+
+def _parting(floater, hour):
+    '''
+    When floater gets more than PARTING from everyone sharing its sea
+    room, or None if that is not within HORIZON.
+    '''
+    mates = roommates(floater)
+    if not mates:
+        return None
+    start, course, speed = floater.segment or (hour, 0.0, 0.0)
+    position = floater.position_at(hour, decimals=None)
+    lats, lons = reckon(mates, hour, decimals=None)
+    x, y = _offsets(position, lats, lons)
+    segments = [mate.segment or (hour, 0.0, 0.0) for mate in mates]
+    vx, vy = _velocity([segment[1] for segment in segments],
+                       [segment[2] for segment in segments])
+    own_vx, own_vy = _velocity(course, speed)
+    # relative motion: the later time |p + w t| = PARTING
+    wx, wy = vx - own_vx, vy - own_vy
+    a = wx * wx + wy * wy
+    b = 2 * (x * wx + y * wy)
+    c = x * x + y * y - PARTING * PARTING
+    disc = b * b - 4 * a * c
+    moving = (a > 1e-12) & (disc >= 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(moving, (-b + np.sqrt(np.where(moving, disc, 0))) /
+                     np.where(moving, 2 * a, 1), np.inf)
+    # never that close again, or drifting apart already
+    t[(c >= 0) & ((disc < 0) | (t < 0))] = 0.0
+    t[(a <= 1e-12) & (c >= 0)] = 0.0
+    t = max(float(t.max()), 0.0)
+    if t > HORIZON:
+        return None
+    return (hour + t, "parting", None)
+
+
+def ranges(position, lats, lons):
+    '''
+    Distances in nautical miles from position to arrays of lats and lons,
+    on a flat chart around position; good for short ranges.
+    '''
+    x, y = _offsets(position, lats, lons)
+    return np.hypot(x, y)
+
+
+def _offsets(position, lats, lons):
+    '''
+    East and north offsets in nautical miles from position to arrays of
+    lats and lons, on a flat chart around position.
+    '''
+    dlat = np.asarray(lats, dtype=float) - position[0]
+    dlon = (np.asarray(lons, dtype=float) - position[1] + 540.0) % 360.0 \
+        - 180.0
+    return dlon * 60.0 * np.cos(np.radians(position[0])), dlat * 60.0
+
+
+def _velocity(courses, speeds):
+    '''
+    East and north components in knots of courses and speeds.
+    '''
+    courses = np.radians(np.asarray(courses, dtype=float))
+    speeds = np.asarray(speeds, dtype=float)
+    return speeds * np.sin(courses), speeds * np.cos(courses)
+
+# last line
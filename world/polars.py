@@ -0,0 +1,180 @@
+# The Polars
+"""
+A registry of sailing polars: boat speed for any true wind angle (TWA) and
+true wind speed (TWS).
+
+Polars live in the POL folder as .pol files, tab separated tables with TWS
+across the top and a row per TWA:
+
+    TWA/TWS  0.0   2.0   4.0 ...
+    0.0      0.00  0.00  0.00 ...
+    ...
+
+Each file is parsed once at server start and resampled onto one common
+grid, TWA 0-180 and TWS 0-MAX_TWS, in 1 degree and 1 knot steps. The
+resampled table is cached as a compiled binary (.polc) next to the .pol so
+later starts skip the parsing. All polars are stacked in one array, so a
+lookup for a whole fleet with different polars is a single bilinear
+interpolation over array indices.
+
+Vessels name their polar in db.polar, which is the file name without the
+extension, e.g. "test" for POL/test.pol.
+"""
+
+import os
+import struct
+import numpy as np
+from django.conf import settings
+
+MAX_TWS = 60  # knots, the top of the common grid
+MAGIC = "PPOL"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")
+_SHAPE = (181, MAX_TWS + 1)  # TWA 0-180, TWS 0-MAX_TWS
+
+_INDEX = {}  # polar name -> row in _TABLE
+_TABLE = np.zeros((0,) + _SHAPE, dtype=np.float32)  # all polars stacked
+
+
+def load(directory=None):
+    '''
+    Load every .pol in directory (default settings.POLAR_DIR, or the POL
+    folder of the game) into the registry. Returns the number loaded.
+    '''
+    global _TABLE
+    if directory is None:
+        directory = getattr(settings, "POLAR_DIR", None) or os.path.join(
+            settings.GAME_DIR, "POL")
+    names, tables = [], []
+    for filename in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(filename)
+        if extension != ".pol":
+            continue
+        names.append(name)
+        tables.append(compile_polar(os.path.join(directory, filename)))
+    _INDEX.clear()
+    _INDEX.update((name, row) for row, name in enumerate(names))
+    if tables:
+        _TABLE = np.array(tables, dtype=np.float32)
+    else:
+        _TABLE = np.zeros((0,) + _SHAPE, dtype=np.float32)
+    return len(names)
+
+
+def names():
+    '''
+    The names of all loaded polars.
+    '''
+    return sorted(_INDEX)
+
+
+def index(name):
+    '''
+    The row of a named polar for boat_speeds(), or None if not loaded.
+    '''
+    return _INDEX.get(name)
+
+
+def boat_speed(name, twa, tws):
+    '''
+    Boat speed in knots for the named polar at a true wind angle in degrees
+    and true wind speed in knots. Zero for an unknown polar.
+    '''
+    row = index(name)
+    if row is None:
+        return 0.0
+    return float(boat_speeds(row, twa, tws))
+
+
+def boat_speeds(rows, twas, twss):
+    '''
+    Batch form of boat_speed. rows are polar rows from index(), twas and
+    twss arrays of true wind angles and speeds. Returns boat speeds.
+    '''
+    table = _TABLE
+    rows = np.asarray(rows, dtype=int)
+    twa = np.abs((np.asarray(twas, dtype=float) + 180.0) % 360.0 - 180.0)
+    tws = np.clip(np.asarray(twss, dtype=float), 0, MAX_TWS)
+    i0 = np.minimum(np.floor(twa).astype(int), 179)
+    j0 = np.minimum(np.floor(tws).astype(int), MAX_TWS - 1)
+    fi = twa - i0
+    fj = tws - j0
+    return (table[rows, i0, j0] * (1 - fi) * (1 - fj) +
+            table[rows, i0, j0 + 1] * (1 - fi) * fj +
+            table[rows, i0 + 1, j0] * fi * (1 - fj) +
+            table[rows, i0 + 1, j0 + 1] * fi * fj)
+
+
+def compile_polar(path):
+    '''
+    The resampled table for the .pol at path, from its .polc cache if that
+    is newer than the .pol, otherwise parsed and written to the cache.
+    '''
+    cache = path + "c"
+    if (os.path.exists(cache) and
+            os.path.getmtime(cache) >= os.path.getmtime(path)):
+        table = read_cache(cache)
+        if table is not None:
+            return table
+    twas, twss, speeds = parse_pol(path)
+    table = resample(twas, twss, speeds)
+    try:
+        write_cache(cache, table)
+    except (IOError, OSError):
+        pass  # a read-only POL folder just means parsing every start
+    return table
+
+
+def parse_pol(path):
+    '''
+    Read a .pol file. Returns the TWA and TWS axes and the speed table
+    shaped (TWA, TWS).
+    '''
+    with open(path) as pol:
+        lines = [line.split() for line in pol if line.strip()]
+    twss = [float(tws) for tws in lines[0][1:]]
+    twas = [float(line[0]) for line in lines[1:]]
+    speeds = [[float(speed) for speed in line[1:len(twss) + 1]]
+              for line in lines[1:]]
+    return np.array(twas), np.array(twss), np.array(speeds)
+
+
+def resample(twas, twss, speeds):
+    '''
+    Resample a speed table onto the common TWA/TWS grid. Outside the table
+    the speed at its nearest edge is used.
+    '''
+    grid_twa = np.arange(_SHAPE[0], dtype=float)
+    grid_tws = np.arange(_SHAPE[1], dtype=float)
+    by_tws = np.array([np.interp(grid_tws, twss, row) for row in speeds])
+    table = np.array([np.interp(grid_twa, twas, column)
+                      for column in by_tws.T]).T
+    return table.astype(np.float32)
+
+
+def read_cache(path):
+    '''
+    The table in a .polc cache, or None if it is not a usable cache.
+    '''
+    with open(path, "rb") as cache:
+        header = cache.read(HEADER.size)
+        if len(header) != HEADER.size:
+            return None
+        magic, version, ntwa, ntws = HEADER.unpack(header)
+        if (magic, version, (ntwa, ntws)) != (MAGIC, VERSION, _SHAPE):
+            return None
+        table = np.fromfile(cache, dtype="<f4", count=ntwa * ntws)
+    if table.size != ntwa * ntws:
+        return None
+    return table.reshape(_SHAPE)
+
+
+def write_cache(path, table):
+    '''
+    Write a resampled table as a .polc cache.
+    '''
+    with open(path, "wb") as cache:
+        cache.write(HEADER.pack(MAGIC, VERSION, _SHAPE[0], _SHAPE[1]))
+        cache.write(np.asarray(table, dtype="<f4").tostring())
+
+# last line
@@ -0,0 +1,98 @@
+# The Room Pool
+"""
+A pool of free dynamic sea rooms.
+
+arrive_at used to create a new DynamicRoom ("The Open Ocean") every time a
+vessel sailed out of a shared or fixed room, and empty ones were only
+deleted on server reload, so the object table kept growing in between.
+Creating and deleting rooms are about the most expensive things the
+database does for us. Instead, a sea room that loses its last occupant is
+released to the pool, and acquire() hands a pooled room out again before
+it creates a new one.
+
+A pooled room has no coordinates, so the atlas never finds it, and has
+db.pooled set so the pool can be rebuilt at server start. The pool holds at
+most ROOM_POOL_SIZE rooms; beyond that released rooms are deleted.
+"""
+
+from django.conf import settings
+from twisted.internet import reactor
+from evennia.utils import search
+from evennia.utils.create import create_object
+from world import atlas, writeback
+
+POOL_SIZE = getattr(settings, "ROOM_POOL_SIZE", 100)
+KEY = "The Open Ocean"
+
+_FREE = {}  # room id -> free dynamic room
+
+
+def acquire(position):
+    '''
+    A dynamic sea room at position, from the pool if there is one free.
+    '''
+    room = None
+    while _FREE and room is None:
+        room = _FREE.popitem()[1]
+        if not room.pk or room.contents:  # deleted or in use after all
+            room = None
+    if room is None:
+        room = create_object(typeclass="rooms.DynamicRoom", key=KEY,
+                             location=None)
+    else:
+        room.db.pooled = False
+        room.key = KEY
+    atlas.set_coordinates(room, position)
+    return room
+
+
+def release(room, leaving=None):
+    '''
+    Put an empty dynamic room back in the pool. leaving is an object that
+    is on its way out and does not count as an occupant. Rooms that are
+    not empty are left alone; when the pool is full the room is deleted,
+    just after the move that emptied it is done.
+    '''
+    if room.id in _FREE or any(obj != leaving for obj in room.contents):
+        return False
+    if len(_FREE) >= POOL_SIZE:
+        reactor.callLater(0, _delete, room)
+        return True
+    atlas.set_coordinates(room, None)
+    writeback.forget(room)
+    room.db.desc = None
+    room.db.pooled = True
+    _FREE[room.id] = room
+    return True
+
+
+def free():
+    '''
+    Number of rooms in the pool.
+    '''
+    return len(_FREE)
+
+
+def forget(room):
+    '''
+    Drop a room from the pool, e.g. when it is deleted.
+    '''
+    _FREE.pop(room.id, None)
+
+
+def rebuild():
+    '''
+    Rebuild the pool from the pooled rooms in the database.
+    '''
+    _FREE.clear()
+    for room in search.search_object_attribute(key="pooled", value=True):
+        if not room.contents:
+            _FREE[room.id] = room
+    return len(_FREE)
+
+
+def _delete(room):
+    if room.pk and not room.contents:
+        room.delete()
+
+# last line
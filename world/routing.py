@@ -0,0 +1,202 @@
+# Weather Routing
+"""
+The fastest way under sail from a fix to a destination, in the wind and
+current forecast along the way.
+
+plan() runs an isochrone search. Starting from the start fix, every point
+of the front is sailed for one step on each of HEADINGS, and on the heading
+straight for the destination; the points reached make the next front, the
+isochrone: everywhere the vessel can be after that many steps. Each step
+
+    1. samples the forecast (weather.forecast) at the hour of the front,
+       once per point
+    2. looks up the boat speed for every point and heading in one go
+       (sailing.sail_speeds) and adds the current, as the fleet does
+    3. moves every point along its rhumb line at once, and drops the legs
+       that touch land (landmask.crossings)
+    4. thins the front to the point farthest from the start in each
+       SECTOR degrees of bearing from the start, so it stays a few hundred
+       points however long the passage
+
+until the destination is within a step of some point. The earliest
+arrival is traced back through the fronts to the start.
+
+Steps get longer for longer passages, so that a passage takes about
+ISOCHRONES steps, but no shorter than MIN_STEP hours. An ocean crossing is
+then some tens of steps of a few thousand legs each, all numpy, and plans
+in under a second. A destination on land is turned down before searching,
+and the search gives up after MAX_STEPS steps, or once the front has got
+no nearer the destination for STALL steps, so a destination boxed in by
+land or out of reach costs no more than a couple of normal passages.
+
+A route is a list of timed waypoints (hour, (lat, lon), heading): the
+start, every change of heading and the destination, with the heading to
+steer from each waypoint to the next (None at the destination).
+"""
+
+import numpy as np
+from world import clock, landmask, metrics, polars, sailing, weather
+from world.fields import to_polar
+from world.globe import measure, measure_vectors, rhumb_vectors
+
+HEADINGS = np.arange(0.0, 360.0, 5.0)  # degrees, the fan sailed each step
+SECTOR = 2.0  # degrees of bearing from the start, one front point each
+ISOCHRONES = 60  # about this many steps for any passage
+MIN_STEP = 1.0  # simulation hours, the shortest step
+SPEED = 5.0  # knots, what a passage is expected to make, to size steps
+MAX_HOURS = 24 * 90.0  # give up on passages longer than this
+MAX_STEPS = 2 * ISOCHRONES  # or taking more steps than this
+STALL = ISOCHRONES // 4  # or getting no nearer for this many steps
+TURN = 1.0  # degrees, smaller changes of heading are not waypoints
+ARRIVAL = 0.5  # nautical miles from the destination counts as there
+
+
+@metrics.timed("routing.plan")
+def plan(start, destination, polar, hour=None, sails=1.0):
+    '''
+    The fastest route from the (lat, lon) fix start to destination for a
+    vessel with the named polar and sails set, leaving at hour (default
+    now). Returns timed waypoints, see the module doc, or None if there is
+    no way there within the limits above, the destination is on land or
+    the polar is unknown.
+    '''
+    row = polars.index(polar)
+    if row is None or landmask.is_land(destination):
+        return None
+    if hour is None:
+        hour = clock.now()
+    distance = measure(start, destination)[1]
+    if distance <= ARRIVAL:
+        return [(hour, tuple(start), None)]
+    step = max(MIN_STEP, distance / (ISOCHRONES * SPEED))
+    lats = np.array([start[0]], dtype=float)
+    lons = np.array([start[1]], dtype=float)
+    # per front: lats, lons, index of the point it came from, heading
+    fronts = [(lats, lons, np.array([-1]), np.array([np.nan]))]
+    elapsed = 0.0
+    nearest, stalled = distance, 0
+    for _ in range(MAX_STEPS):
+        if elapsed >= MAX_HOURS or stalled > STALL:
+            break
+        courses, speeds, headings = _sail(lats, lons, destination, row,
+                                          sails, hour + elapsed)
+        arrival = _arrival(lats, lons, destination, courses[:, -1],
+                           speeds[:, -1], step)
+        if arrival is not None:
+            index, hours = arrival
+            return _trace(fronts, index, headings[index, -1],
+                          destination, hour, elapsed + hours, step)
+        lats, lons, parents, headings = _advance(
+            lats, lons, courses, speeds * step, headings, start)
+        if not lats.size:
+            return None  # boxed in by land, or becalmed
+        fronts.append((lats, lons, parents, headings))
+        elapsed += step
+        closest = measure_vectors(lats, lons, destination[0],
+                                  destination[1])[1].min()
+        if closest < nearest - ARRIVAL:
+            nearest, stalled = closest, 0
+        else:
+            stalled += 1  # held off by land, or the wind
+    return None
+
+
+def _sail(lats, lons, destination, row, sails, hour):
+    '''
+    Course and speed over ground from each point of the front on each
+    heading, as arrays shaped (points, headings). The last heading of each
+    point is straight for the destination.
+    '''
+    bearings = measure_vectors(lats, lons, destination[0],
+                               destination[1])[0]
+    headings = np.empty((lats.size, HEADINGS.size + 1))
+    headings[:, :-1] = HEADINGS
+    headings[:, -1] = bearings
+    forecast = weather.forecast(hour)
+    if forecast is None:
+        wind_dirs = wind_speeds = np.zeros(lats.shape)
+        current_u = current_v = wind_dirs
+    else:
+        wind_dirs, wind_speeds = forecast[0].vectors(lats, lons)
+        current_u, current_v = forecast[1].sample(lats, lons)
+    speeds = sailing.sail_speeds(row, headings, wind_dirs[:, None],
+                                 wind_speeds[:, None], sails)
+    radians = np.radians(headings)
+    courses, speeds = to_polar(speeds * np.sin(radians) + current_u[:, None],
+                               speeds * np.cos(radians) + current_v[:, None])
+    return courses, speeds, headings
+
+
+def _arrival(lats, lons, destination, courses, speeds, step):
+    '''
+    The earliest arrival at destination from a point of the front, heading
+    straight for it, within one step: (point index, hours), or None.
+    '''
+    bearings, distances = measure_vectors(lats, lons, destination[0],
+                                          destination[1])
+    made_good = speeds * np.cos(np.radians(courses - bearings))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hours = np.where(made_good > 0, distances / made_good, np.inf)
+    close = (hours <= step).nonzero()[0]
+    if not close.size:
+        return None
+    clear = ~landmask.crossings(lats[close], lons[close], bearings[close],
+                                distances[close])
+    if not clear.any():
+        return None
+    close = close[clear]
+    index = close[np.argmin(hours[close])]
+    return int(index), float(hours[index])
+
+
+def _advance(lats, lons, courses, distances, headings, start):
+    '''
+    The next front: every point sailed on every course, legs over land
+    dropped, thinned to the farthest point in each sector around start.
+    Returns lats, lons, parent indices and headings of the new front.
+    '''
+    parents = np.repeat(np.arange(lats.size), courses.shape[1])
+    courses, distances = courses.ravel(), distances.ravel()
+    headings = headings.ravel()
+    lats = np.repeat(lats, courses.size // lats.size)
+    lons = np.repeat(lons, courses.size // lons.size)
+    moving = (distances > 1e-6).nonzero()[0]
+    moving = moving[~landmask.crossings(lats[moving], lons[moving],
+                                        courses[moving], distances[moving])]
+    new_lats, new_lons = rhumb_vectors(lats[moving], lons[moving],
+                                       courses[moving], distances[moving],
+                                       None)
+    bearings, ranges = measure_vectors(start[0], start[1], new_lats,
+                                       new_lons)
+    sectors = (bearings // SECTOR).astype(int)
+    # farthest from the start first within each sector, keep the first
+    order = np.lexsort((-ranges, sectors))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = sectors[order][1:] != sectors[order][:-1]
+    keep = order[first]
+    return (new_lats[keep], new_lons[keep], parents[moving][keep],
+            headings[moving][keep])
+
+
+def _trace(fronts, index, heading, destination, hour, hours, step):
+    '''
+    The waypoints from the start to destination, reached from point index
+    of the last front on heading after hours in all.
+    '''
+    path = []  # (lat, lon, heading from there) back from the last front
+    for lats, lons, parents, headings in reversed(fronts):
+        path.append((float(lats[index]), float(lons[index]), heading))
+        heading = headings[index]
+        index = parents[index]
+    path.reverse()
+    waypoints = []
+    for number, (lat, lon, heading) in enumerate(path):
+        if waypoints and abs((heading - waypoints[-1][2] + 180.0) % 360.0
+                             - 180.0) < TURN:
+            continue  # much the same heading on, not a turn
+        waypoints.append((hour + number * step, (lat, lon), float(heading)))
+    waypoints.append((hour + hours, tuple(destination), None))
+    return waypoints
+
+
+# last line
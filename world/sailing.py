@@ -0,0 +1,49 @@
+# Sailing
+"""
+Turning wind into boat speed with a vessel's polar.
+
+Wind vectors in the globe module point the way the wind blows, so a wind
+of (90, 10) blows towards the east out of the west. The true wind angle
+(TWA) is the angle between the vessel's heading and the direction the wind
+comes from: 0 is head to wind, 180 is dead downwind.
+
+Boat speed is the polar speed at that TWA and the true wind speed, scaled
+by how much sail is set (db.sails, 0 to 1). Everything here works on arrays
+so the fleet tick can sail every vessel at once; the single vessel forms
+are thin wrappers.
+"""
+
+import numpy as np
+from world import polars
+
+
+def true_wind_angles(headings, wind_directions):
+    '''
+    TWA in degrees, 0 to 180, for arrays of headings and wind directions.
+    '''
+    wind_from = np.asarray(wind_directions, dtype=float) + 180.0
+    angle = (np.asarray(headings, dtype=float) - wind_from) % 360.0
+    return np.where(angle > 180.0, 360.0 - angle, angle)
+
+
+def sail_speeds(rows, headings, wind_directions, wind_speeds, sails):
+    '''
+    Boat speeds through the water for arrays of polar rows (from
+    polars.index), headings, wind and sail set.
+    '''
+    twas = true_wind_angles(headings, wind_directions)
+    speeds = polars.boat_speeds(rows, twas, wind_speeds)
+    return speeds * np.asarray(sails, dtype=float)
+
+
+def sail_speed(polar, heading, wind, sails=1.0):
+    '''
+    Boat speed for one vessel with the named polar. Zero for an unknown
+    polar.
+    '''
+    row = polars.index(polar)
+    if row is None:
+        return 0.0
+    return float(sail_speeds(row, heading, wind[0], wind[1], sails))
+
+# last line
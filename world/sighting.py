@@ -0,0 +1,176 @@
+# Sighting
+"""
+What the lookouts of crewed vessels can see: other vessels and the coast.
+
+Looking around used to stop at the room the vessel is in. Now every
+SIGHTING_INTERVAL seconds a sweep puts every vessel and coastal room in a
+k-d tree (see world/spatial.py) and asks it, for each vessel with a player
+aboard, what is within the visual horizon. A sweep costs one tree build
+plus one query per crewed vessel, however large the fleet.
+
+The horizon depends on height. From a height of h feet the horizon is
+HORIZON_FACTOR * sqrt(h) nautical miles away, and two things see each other
+when they are closer than the sum of their horizons. Heights are the
+crew's eye height (db.eye_height, default EYE_HEIGHT) and the masthead of
+a vessel (db.height, default MAST_HEIGHT) or the elevation of a coastal
+room (db.elevation, default ELEVATION).
+
+Every crewed vessel keeps its contacts, with bearing and range, in
+ndb.contacts. Only changes are reported to the crew: a new contact (a sail
+for a vessel, something adrift for flotsam) and one lost from sight;
+contacts() has the whole picture for the lookout command.
+
+Floaters adrift are on the fleet list; floaters at anchor are kept here,
+see moor(). Both lists live in memory and are rebuilt at server start (see
+server/conf/at_server_startstop.py).
+"""
+
+import math
+import numpy as np
+from django.conf import settings
+from evennia import TICKER_HANDLER as tickerhandler
+from evennia.utils import search
+from world import atlas, bulletin, clock, fleet, metrics, navigation
+from world.clock import TICK
+from world.globe import measure_vectors
+from world.spatial import KDTree
+
+INTERVAL = getattr(settings, "SIGHTING_INTERVAL", TICK)  # seconds
+HORIZON_FACTOR = 1.17  # nautical miles per root foot, with refraction
+EYE_HEIGHT = 15.0  # feet, the lookout's eye above the water
+MAST_HEIGHT = 30.0  # feet, the highest part of a vessel
+ELEVATION = 100.0  # feet, the highest land of a coastal room
+
+_MOORED = {}  # floater id -> floater at anchor
+_COAST = {"chart": None, "rooms": [], "fixes": [], "heights": []}
+
+
+def start():
+    '''
+    Start the sighting sweep. Not persistent since at_server_start always
+    starts it again.
+    '''
+    tickerhandler.add(INTERVAL, sweep, idstring="sighting", persistent=False)
+
+
+def rebuild():
+    '''
+    Rebuild the list of floaters at anchor from the database: every floater
+    with a position that is not adrift, including those never cast off.
+    '''
+    _MOORED.clear()
+    for floater in search.search_object_attribute(key="position"):
+        if hasattr(floater, "position_at") and not floater.db.adrift:
+            _MOORED[floater.id] = floater
+    return len(_MOORED)
+
+
+def moor(floater):
+    '''
+    Keep floater in sight while it is at anchor and off the fleet list.
+    '''
+    _MOORED[floater.id] = floater
+
+
+def forget(floater):
+    '''
+    Drop floater from the anchored list, e.g. when it casts off.
+    '''
+    _MOORED.pop(floater.id, None)
+
+
+def horizon(height):
+    '''
+    Distance in nautical miles to the horizon from height feet.
+    '''
+    return HORIZON_FACTOR * math.sqrt(max(height, 0.0))
+
+
+@metrics.timed("sighting.sweep")
+def sweep():
+    '''
+    Called every INTERVAL seconds. Work out the contacts of every crewed
+    vessel and tell the crews what has changed.
+    '''
+    vessels = dict((floater.id, floater) for floater in fleet.floaters())
+    vessels.update(_MOORED)
+    vessels = [floater for floater in vessels.values() if floater.fix]
+    lookouts = []
+    for index, floater in enumerate(vessels):
+        if fleet.crewed(floater):
+            lookouts.append(index)
+        else:
+            floater.ndb.contacts = None  # start afresh with the next crew
+    if not lookouts:
+        return
+    hour = clock.now()
+    lats, lons = navigation.reckon(vessels, hour, decimals=None)
+    heights = [horizon(floater.db.height or MAST_HEIGHT)
+               for floater in vessels]
+    _chart()
+    marks = vessels + _COAST["rooms"]
+    lats = np.append(lats, [fix[0] for fix in _COAST["fixes"]])
+    lons = np.append(lons, [fix[1] for fix in _COAST["fixes"]])
+    heights = np.array(heights + _COAST["heights"])
+    tree = KDTree(lats, lons)
+    tallest = heights.max()
+    for index in lookouts:
+        lookout = vessels[index]
+        position = (lats[index], lons[index])
+        eye = horizon(lookout.db.eye_height or EYE_HEIGHT)
+        near = tree.near(position, eye + tallest)
+        bearings, ranges = measure_vectors(position[0], position[1],
+                                           lats[near], lons[near])
+        contacts = {}
+        for mark, bearing, distance in zip(
+                near.tolist(), bearings.tolist(), ranges.tolist()):
+            if mark != index and distance <= eye + heights[mark]:
+                contacts[marks[mark].id] = (marks[mark], bearing, distance)
+        _report(lookout, contacts)
+
+
+def contacts(vessel):
+    '''
+    The contacts of vessel as of the last sweep, (object, bearing, range)
+    nearest first.
+    '''
+    found = (vessel.ndb.contacts or {}).values()
+    return sorted(found, key=lambda contact: contact[2])
+
+
+def _report(vessel, contacts):
+    '''
+    Tell the crew of vessel about new contacts and ones lost from sight.
+    '''
+    old = vessel.ndb.contacts or {}
+    for key in set(contacts) - set(old):
+        mark, bearing, distance = contacts[key]
+        if mark.is_typeclass("rooms.CoastalRoom"):
+            string = "Land ho! %s bears %03d, %.1f nautical miles off."
+        elif mark.is_typeclass("vessel.VesselObject"):
+            string = "Sail ho! The %s bears %03d, %.1f nautical miles off."
+        else:
+            # unmanned floaters are flotsam, not sails
+            string = ("Something adrift! The %s bears %03d, %.1f nautical "
+                      "miles off.")
+        bulletin.post(vessel, string, mark.key, bearing, distance)
+    for key in set(old) - set(contacts):
+        bulletin.post(vessel, "The %s is lost from sight.", old[key][0].key)
+    vessel.ndb.contacts = contacts
+
+
+def _chart():
+    '''
+    Bring the coastal rooms up to date with the atlas.
+    '''
+    if _COAST["chart"] == atlas.version():
+        return
+    rooms = [room for room in atlas.rooms()
+             if room.is_typeclass("rooms.CoastalRoom") and
+             atlas.coordinates(room)]
+    _COAST.update(chart=atlas.version(), rooms=rooms,
+                  fixes=[atlas.coordinates(room) for room in rooms],
+                  heights=[horizon(room.db.elevation or ELEVATION)
+                           for room in rooms])
+
+# last line
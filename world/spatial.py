@@ -0,0 +1,192 @@
+# Spatial Indexes
+"""
+Spatial indexes of things on the globe: who is near a fix.
+
+SpatialHash is for things that keep moving, one at a time; KDTree is for a
+snapshot of many fixes that is built once and then asked many questions.
+
+In a SpatialHash things are filed in square buckets SIZE nautical miles
+across (measured along the meridian; buckets get narrower towards the
+poles), so finding everything within some range of a fix only looks at the
+few buckets that range covers. The cost is the number of things nearby,
+not the number of things in the world.
+
+Longitude wraps around at the date line. A KDTree keeps its fixes as
+points on the unit sphere, so it has no trouble with the date line or the
+poles either. This module only needs numpy, no game modules.
+"""
+
+import math
+import numpy as np
+
+
+class SpatialHash(object):
+    """
+    Things with a (lat, lon) fix, in buckets size nautical miles across.
+    """
+    def __init__(self, size):
+        self.size = float(size)
+        self.degrees = self.size / 60.0  # bucket size in degrees
+        self.columns = int(math.ceil(360.0 / self.degrees))
+        self._buckets = {}  # bucket key -> {thing id: thing}
+        self._keys = {}  # thing id -> bucket key
+
+    def __len__(self):
+        return len(self._keys)
+
+    def key(self, position):
+        '''
+        The bucket of a (lat, lon) fix.
+        '''
+        return (int(math.floor(position[0] / self.degrees)),
+                int(math.floor((position[1] + 180.0) / self.degrees)) %
+                self.columns)
+
+    def keys(self, lats, lons):
+        '''
+        The buckets of arrays of lats and lons, as arrays of rows and
+        columns.
+        '''
+        rows = np.floor(np.asarray(lats, dtype=float) / self.degrees)
+        columns = np.floor((np.asarray(lons, dtype=float) + 180.0) /
+                           self.degrees) % self.columns
+        return rows.astype(int), columns.astype(int)
+
+    def file(self, thing_id, thing, position):
+        '''
+        File thing at position, moving it if it is filed already.
+        Returns True if it changed bucket.
+        '''
+        key = self.key(position)
+        old = self._keys.get(thing_id)
+        if old == key:
+            return False
+        if old is not None:
+            self._drop(thing_id, old)
+        self._buckets.setdefault(key, {})[thing_id] = thing
+        self._keys[thing_id] = key
+        return True
+
+    def remove(self, thing_id):
+        '''
+        Take thing out of the hash.
+        '''
+        key = self._keys.pop(thing_id, None)
+        if key is not None:
+            self._drop(thing_id, key)
+
+    def clear(self):
+        self._buckets.clear()
+        self._keys.clear()
+
+    def bucket(self, thing_id):
+        '''
+        The bucket thing is filed in, or None.
+        '''
+        return self._keys.get(thing_id)
+
+    def near(self, position, distance):
+        '''
+        Everything filed in the buckets within distance nautical miles of
+        position; a superset of what is actually that close.
+        '''
+        row, column = self.key(position)
+        rows = int(math.ceil(distance / self.size))
+        stretch = max(math.cos(math.radians(min(abs(position[0]), 89.0))),
+                      0.01)
+        columns = min(int(math.ceil(distance / (self.size * stretch))),
+                      self.columns // 2)
+        found = {}
+        for i in range(row - rows, row + rows + 1):
+            for j in range(column - columns, column + columns + 1):
+                bucket = self._buckets.get((i, j % self.columns))
+                if bucket:
+                    found.update(bucket)
+        return found.values()
+
+    def _drop(self, thing_id, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return
+        bucket.pop(thing_id, None)
+        if not bucket:
+            del self._buckets[key]
+
+
+class KDTree(object):
+    """
+    A k-d tree of a fixed set of (lat, lon) fixes, as points on the unit
+    sphere. Finding the fixes within range of a fix costs about the log of
+    their number plus the number found.
+    """
+    LEAF = 16  # fixes in a leaf, looked at all at once
+
+    def __init__(self, lats, lons):
+        lats = np.radians(np.asarray(lats, dtype=float)).ravel()
+        lons = np.radians(np.asarray(lons, dtype=float)).ravel()
+        self.points = _unit_vectors(lats, lons)
+        # nodes are (axis, split, left, right), or (None, indices) leaves
+        self._nodes = []
+        if len(lats):
+            self._build(np.arange(len(lats)))
+
+    def __len__(self):
+        return len(self.points)
+
+    def near(self, position, distance):
+        '''
+        Indices of the fixes within distance nautical miles (great circle)
+        of position.
+        '''
+        if not self._nodes:
+            return np.zeros(0, dtype=int)
+        point = _unit_vectors(np.radians(position[0]),
+                              np.radians(position[1]))
+        # a nautical mile is a minute of arc; compare straight line chords
+        angle = min(distance / 60.0, 180.0)
+        chord = 2 * math.sin(math.radians(angle) / 2)
+        found, stack = [], [0]
+        while stack:
+            node = self._nodes[stack.pop()]
+            if node[0] is None:
+                gaps = self.points[node[1]] - point
+                close = np.einsum("ij,ij->i", gaps, gaps) <= chord * chord
+                found.append(node[1][close])
+                continue
+            axis, split, left, right = node
+            offset = point[axis] - split
+            if offset <= chord:
+                stack.append(left)
+            if offset >= -chord:
+                stack.append(right)
+        return np.concatenate(found)
+
+    def _build(self, indices):
+        '''
+        Build the subtree of indices and return its node number.
+        '''
+        number = len(self._nodes)
+        if len(indices) <= self.LEAF:
+            self._nodes.append((None, indices))
+            return number
+        self._nodes.append(None)  # filled in below, after the children
+        points = self.points[indices]
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        middle = len(indices) // 2
+        order = np.argpartition(points[:, axis], middle)
+        split = float(points[order[middle], axis])
+        left = self._build(indices[order[:middle]])
+        right = self._build(indices[order[middle:]])
+        self._nodes[number] = (axis, split, left, right)
+        return number
+
+
+def _unit_vectors(lats, lons):
+    '''
+    Points on the unit sphere for lats and lons in radians.
+    '''
+    cos_lats = np.cos(lats)
+    return np.stack([cos_lats * np.cos(lons), cos_lats * np.sin(lons),
+                     np.sin(lats)], axis=-1)
+
+# last line
@@ -0,0 +1,261 @@
+# The Weather
+"""
+A process-local weather service in front of the WorldWind script.
+
+get_weather used to run search_script("WorldWind") on every call, which is
+once per vessel per tick. The service resolves the script once, keeps the
+handle and serves wind and current reads from memory. Setting the wind or
+current goes through the service as well, so reads stay consistent without
+asking the database again.
+
+The WorldWind script calls invalidate() when it is stopped, started or
+reloaded so that a stale handle is never used.
+
+The weather can also change over time. A WeatherTimeline is a list of
+keyframes, each a wind and current field at some simulation hour. The
+weather tick (see start) calls advance(), which interpolates the frame
+for the present hour once; every query in between reads that frame.
+A timeline or archive, if set, overrides the base wind and current until
+cleared.
+
+Wind and current are both VectorFields (see world/fields.py): u (east) and
+v (north) components in knots on a regular lat/lon grid, interpolated
+bilinearly at any fix. A global wind set with +setwind is simply a field
+with a single cell. Large gridded weather over many hours is read from a
+memory-mapped archive instead (see world/weather_archive.py).
+
+Vessels dead reckon: they hold a course worked out from the weather until
+something changes it. version() counts weather changes so the fleet knows
+when to work out new courses. It goes up whenever advance() brings new
+fields, and on every weather tick while the weather varies from place to
+place, since vessels sail into different weather as they go.
+"""
+
+import numpy as np
+from evennia import TICKER_HANDLER as tickerhandler
+from evennia.utils import search
+from world import clock
+from world.fields import VectorField
+
+STEP = 4  # simulation hours between weather ticks
+
+_CACHE = {}  # "script", "wind" and "current" once resolved
+_VERSION = 0  # goes up when the weather changes, see version()
+
+
+def world_wind():
+    '''
+    Return the WorldWind script, or None if there isn't one.
+    The database is only searched when there is no cached handle.
+    '''
+    if "script" not in _CACHE:
+        matches = search.search_script("WorldWind")
+        if not matches:
+            return None
+        _CACHE["script"] = matches[0]
+        advance()
+    return _CACHE["script"]
+
+
+def start():
+    '''
+    Start the weather tick. Not persistent since at_server_start always
+    starts it again.
+    '''
+    tickerhandler.add(clock.seconds(STEP), advance, idstring="weather",
+                      persistent=False)
+
+
+def advance(hour=None):
+    '''
+    Work out the weather for hour (default now) once and cache it, so that
+    queries until the next weather tick only sample the cached frame.
+    '''
+    global _VERSION
+    script = _CACHE.get("script") or world_wind()
+    if script is None:
+        return
+    old = (_CACHE.get("wind"), _CACHE.get("current"))
+    timeline = script.timeline()
+    if timeline is None:
+        _CACHE["wind"] = script.wind_field()
+        _CACHE["current"] = script.current_field()
+    else:
+        if hour is None:
+            hour = clock.now()
+        _CACHE["wind"], _CACHE["current"] = timeline.frame(hour)
+    new = (_CACHE["wind"], _CACHE["current"])
+    if (any(field is not before for field, before in zip(new, old)) or
+            not all(_uniform(field) for field in new)):
+        _VERSION += 1
+
+
+def version():
+    '''
+    A number that changes whenever the weather vessels sail in may have
+    changed.
+    '''
+    return _VERSION
+
+
+def forecast(hour):
+    '''
+    The (wind, current) fields at simulation hour, past or future, for
+    planning ahead (see world/routing.py); the cached frame is left alone.
+    None without a WorldWind.
+    '''
+    script = world_wind()
+    if script is None:
+        return None
+    timeline = script.timeline()
+    if timeline is None:
+        return script.wind_field(), script.current_field()
+    return timeline.frame(hour)
+
+
+def invalidate():
+    '''
+    Forget the cached script handle and weather.
+    '''
+    _CACHE.clear()
+
+
+def wind(position):
+    '''
+    The wind (direction, speed) at position. None without a WorldWind.
+    '''
+    if world_wind() is None:
+        return None
+    return _CACHE["wind"].vector(position)
+
+
+def current(position):
+    '''
+    The current (direction, speed) at position. None without a WorldWind.
+    '''
+    if world_wind() is None:
+        return None
+    return _CACHE["current"].vector(position)
+
+
+def winds(lats, lons):
+    '''
+    Batch form of wind(): (directions, speeds) arrays for arrays of fixes.
+    Calm without a WorldWind.
+    '''
+    if world_wind() is None:
+        return _calm(lats)
+    return _CACHE["wind"].vectors(lats, lons)
+
+
+def currents(lats, lons):
+    '''
+    Batch form of current(): (directions, speeds) arrays for arrays of
+    fixes. Slack water without a WorldWind.
+    '''
+    if world_wind() is None:
+        return _calm(lats)
+    return _CACHE["current"].vectors(lats, lons)
+
+
+def set_wind(direction, speed):
+    '''
+    Set one global wind on the WorldWind script and in the cache.
+    Returns False if there is no WorldWind to set it on.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.set_wind(direction, speed)
+    advance()
+    return True
+
+
+def set_current(direction, speed):
+    '''
+    Set one global current on the WorldWind script and in the cache.
+    Returns False if there is no WorldWind to set it on.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.set_current(direction, speed)
+    advance()
+    return True
+
+
+def set_wind_field(field):
+    '''
+    Replace the wind with a gridded VectorField.
+    Returns False if there is no WorldWind to set it on.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.set_wind_field(field)
+    advance()
+    return True
+
+
+def set_current_field(field):
+    '''
+    Replace the current with a gridded VectorField.
+    Returns False if there is no WorldWind to set it on.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.set_current_field(field)
+    advance()
+    return True
+
+
+def add_keyframe(hour, wind_field, current_field):
+    '''
+    Add a keyframe to the weather timeline at simulation hour.
+    Returns False if there is no WorldWind to set it on.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.add_keyframe(hour, wind_field, current_field)
+    advance()
+    return True
+
+
+def set_archive(path):
+    '''
+    Drive the weather from the memory-mapped archive at path, see
+    world/weather_archive.py. Returns False if there is no WorldWind.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.set_archive(path)
+    advance()
+    return True
+
+
+def clear_timeline():
+    '''
+    Drop the weather timeline or archive and go back to the base wind and
+    current.
+    Returns False if there is no WorldWind.
+    '''
+    script = world_wind()
+    if script is None:
+        return False
+    script.clear_timeline()
+    advance()
+    return True
+
+
+def _uniform(field):
+    return isinstance(field, VectorField) and field.u.size == 1
+
+
+def _calm(lats):
+    zeros = np.zeros(np.shape(lats))
+    return zeros, zeros.copy()
+
+# last line
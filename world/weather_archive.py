@@ -0,0 +1,145 @@
+# The Weather Archive
+"""
+A binary, memory-mapped archive of gridded wind and current over time.
+
+Global weather at a useful resolution, kept for many hours, is far too big
+for Attribute pickles on the WorldWind script. An archive is one file:
+
+    header   struct HEADER, little endian:
+               magic "PWXA", version, latitudes, longitudes, frames,
+               data offset in bytes, lat0, lon0, step (degrees)
+    hours    float64 * frames, simulation hour of each frame
+    data     float32 * frames * 4 * latitudes * longitudes, starting at the
+             data offset; for each frame the planes wind u, wind v,
+             current u, current v (knots, u east and v north)
+
+WeatherArchive maps the file read-only and hands out VectorFields that are
+views straight into the map, so nothing is copied and the OS only pages in
+the parts of the grid that vessels actually sample. It has the same frame()
+method as a WeatherTimeline so the weather service treats them alike.
+
+import_csv() builds an archive from a plain text grid, one cell per line:
+
+    hour,lat,lon,wind_direction,wind_speed,current_direction,current_speed
+
+Lines starting with # and a header line are skipped, cells not listed are
+calm. From the game directory:
+
+    python -m world.weather_archive weather.csv weather.pwx [step]
+"""
+
+import struct
+import sys
+from bisect import bisect_right
+import numpy as np
+from world.fields import VectorField, BlendedField, to_components
+
+MAGIC = "PWXA"
+VERSION = 1
+HEADER = struct.Struct("<4sIIIIIddd")
+PLANES = 4  # wind u, wind v, current u, current v
+
+
+class WeatherArchive(object):
+    """
+    A read-only, memory-mapped weather archive.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as archive:
+            header = HEADER.unpack(archive.read(HEADER.size))
+            (magic, version, nlat, nlon, frames, offset,
+             self.lat0, self.lon0, self.step) = header
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("%s is not a version %s weather archive."
+                                 % (path, VERSION))
+            self.hours = list(np.fromfile(archive, dtype="<f8",
+                                          count=frames))
+        self.data = np.memmap(path, dtype="<f4", mode="r", offset=offset,
+                              shape=(frames, PLANES, nlat, nlon))
+
+    def fields(self, index):
+        '''
+        The (wind, current) VectorFields of frame index, as views.
+        '''
+        planes = self.data[index]
+        grid = (self.lat0, self.lon0, self.step)
+        return (VectorField(planes[0], planes[1], *grid),
+                VectorField(planes[2], planes[3], *grid))
+
+    def frame(self, hour):
+        '''
+        The (wind, current) fields at hour. Between frames the fields are
+        blended only where they are sampled, before the first and after the
+        last frame the weather holds.
+        '''
+        index = bisect_right(self.hours, hour)
+        if index == 0:
+            return self.fields(0)
+        if index == len(self.hours):
+            return self.fields(-1)
+        before, after = self.hours[index - 1], self.hours[index]
+        fraction = (hour - before) / float(after - before)
+        wind_a, current_a = self.fields(index - 1)
+        wind_b, current_b = self.fields(index)
+        return (BlendedField(wind_a, wind_b, fraction),
+                BlendedField(current_a, current_b, fraction))
+
+
+def write_archive(path, hours, data, lat0, lon0, step):
+    '''
+    Write an archive. data is an array shaped
+    (frames, 4, latitudes, longitudes), see the module doc for the planes.
+    '''
+    data = np.asarray(data, dtype="<f4")
+    frames, planes, nlat, nlon = data.shape
+    if planes != PLANES or frames != len(hours):
+        raise ValueError("Weather data does not match its hours.")
+    offset = HEADER.size + 8 * frames
+    offset += -offset % 16  # keep the data aligned
+    with open(path, "wb") as archive:
+        archive.write(HEADER.pack(MAGIC, VERSION, nlat, nlon, frames,
+                                  offset, lat0, lon0, step))
+        archive.write(np.asarray(hours, dtype="<f8").tostring())
+        archive.write("\0" * (offset - archive.tell()))
+        archive.write(data.tostring())
+
+
+def import_csv(csv_path, archive_path, step=1.0):
+    '''
+    Build an archive from a text grid (see the module doc). The grid covers
+    the lat/lon box of the cells listed, step degrees apart.
+    Returns the number of frames written.
+    '''
+    rows = np.atleast_2d(np.genfromtxt(csv_path, delimiter=",",
+                                       comments="#", dtype=float))
+    rows = rows[~np.isnan(rows).any(axis=1)]  # drops a header line
+    if not len(rows):
+        raise ValueError("No weather in %s." % csv_path)
+    hours = sorted(set(rows[:, 0].tolist()))
+    lat0, lon0 = rows[:, 1].min(), rows[:, 2].min()
+    nlat = int(round((rows[:, 1].max() - lat0) / step)) + 1
+    nlon = int(round((rows[:, 2].max() - lon0) / step)) + 1
+    data = np.zeros((len(hours), PLANES, nlat, nlon), dtype="<f4")
+
+    frame = np.searchsorted(hours, rows[:, 0])
+    i = np.round((rows[:, 1] - lat0) / step).astype(int)
+    j = np.round((rows[:, 2] - lon0) / step).astype(int)
+    wind_u, wind_v = to_components(rows[:, 3], rows[:, 4])
+    current_u, current_v = to_components(rows[:, 5], rows[:, 6])
+    for plane, values in enumerate((wind_u, wind_v, current_u, current_v)):
+        data[frame, plane, i, j] = values
+
+    write_archive(archive_path, hours, data, lat0, lon0, step)
+    return len(hours)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print "Usage: python -m world.weather_archive <csv> <archive> [step]"
+        sys.exit(1)
+    step = float(sys.argv[3]) if len(sys.argv) == 4 else 1.0
+    frames = import_csv(sys.argv[1], sys.argv[2], step)
+    print "Wrote %s frames to %s" % (frames, sys.argv[2])
+
+# last line
@@ -0,0 +1,141 @@
+# Write Behind
+"""
+Write-behind persistence for state that changes every tick.
+
+Vessel positions, headings, power and sails, and the coordinates of the
+dynamic sea rooms that follow them, used to be pickled into an Attribute on
+every move, every few seconds, per vessel. Instead their live values are
+kept in ndb and only marked dirty. flush() saves everything dirty in one
+database transaction; it runs every WRITEBACK_INTERVAL seconds and when the
+server stops or reloads, so a crash loses at most one interval of movement.
+
+Typeclasses declare such state with LiveAttribute:
+
+    class FloatingObject(DefaultObject):
+        position = LiveAttribute("position")
+
+after which obj.position reads the live value (loading it from db the
+first time) and obj.position = x stages a write. A LiveAttribute can name
+a method of the typeclass to call after every change, e.g.
+
+        heading = LiveAttribute("heading", 0.0, "at_steerage_change")
+"""
+
+from django.conf import settings
+from django.db import transaction
+from evennia import TICKER_HANDLER as tickerhandler
+from evennia.utils import logger
+
+INTERVAL = getattr(settings, "WRITEBACK_INTERVAL", 60)  # seconds
+
+_DIRTY = {}  # object id -> (object, set of dirty attribute keys)
+# held in ndb for a live value of None, since ndb reads None for anything
+# not held there at all
+_CLEARED = object()
+
+
+class LiveAttribute(object):
+    """
+    A typeclass attribute whose live value is kept in ndb and written
+    behind to db. changed is the name of a method to call on obj after the
+    value is set.
+    """
+    def __init__(self, key, default=None, changed=None):
+        self.key = key
+        self.default = default
+        self.changed = changed
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        return live(obj, self.key, self.default)
+
+    def __set__(self, obj, value):
+        stage(obj, self.key, value)
+        if self.changed:
+            getattr(obj, self.changed)()
+
+
+def live(obj, key, default=None):
+    '''
+    The live value of key on obj: ndb if it is held there, else db.
+    '''
+    value = getattr(obj.ndb, key)
+    if value is _CLEARED:
+        return default
+    if value is None:
+        value = obj.attributes.get(key)
+        if value is None:
+            return default
+        setattr(obj.ndb, key, value)
+    return value
+
+
+def stage(obj, key, value):
+    '''
+    Change the live value of key on obj and mark it for the next flush.
+    '''
+    setattr(obj.ndb, key, _CLEARED if value is None else value)
+    _DIRTY.setdefault(obj.id, (obj, set()))[1].add(key)
+
+
+def store(obj, key, value):
+    '''
+    Change the live value of key on obj and save it to db right away.
+    '''
+    setattr(obj.ndb, key, _CLEARED if value is None else value)
+    obj.attributes.add(key, value)
+    if obj.id in _DIRTY:
+        _DIRTY[obj.id][1].discard(key)
+
+
+def forget(obj):
+    '''
+    Drop any unsaved changes of obj, e.g. when it is deleted.
+    '''
+    _DIRTY.pop(obj.id, None)
+
+
+def pending():
+    '''
+    Number of objects with unsaved changes.
+    '''
+    return len(_DIRTY)
+
+
+def start():
+    '''
+    Start flushing every INTERVAL seconds. Not persistent since
+    at_server_start always starts it again.
+    '''
+    tickerhandler.add(INTERVAL, flush, idstring="writeback",
+                      persistent=False)
+
+
+def flush():
+    '''
+    Save every dirty value in one transaction. Returns the number of
+    objects saved.
+    '''
+    dirty = _DIRTY.values()
+    _DIRTY.clear()
+    saved = 0
+    try:
+        with transaction.atomic():
+            for obj, keys in dirty:
+                if not obj.pk:  # deleted since it was staged
+                    continue
+                for key in keys:
+                    value = getattr(obj.ndb, key)
+                    obj.attributes.add(key, None if value is _CLEARED
+                                       else value)
+                saved += 1
+    except Exception:
+        # put it all back so the next flush tries again
+        for obj, keys in dirty:
+            _DIRTY.setdefault(obj.id, (obj, set()))[1].update(keys)
+        logger.log_trace("Write-behind flush failed.")
+        return 0
+    return saved
+
+# last line